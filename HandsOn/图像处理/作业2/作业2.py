@@ -1,26 +1,139 @@
+import itertools
 import random
 import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ---------- 可调参数 ----------
+SEGMENT_SIZE = 1 << 18  # 分段筛每段的奇数个数（bool 各占 1 字节，256 KiB 约等于一块 L2）
+SMALL_PRIME_LIMIT = 1000  # 大数分解前先用这以内的素数试除
+MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)  # 对 n < 3.3e24 的 Miller-Rabin 是确定性的
+PERM_BLOCK = 1 << 16  # k-排列按块生成时每块的行数
+CENTER_BLOCK = 1 << 20  # 流式减均值每块的元素个数（float64 临时块 8 MiB），内存占用与数据量无关
+# ------------------------------
 
 # ---------- 功能 1：1/2/3/4 组成无重复三位数 ----------
 def three_digits_1234():
-    digits = [1, 2, 3, 4]
-    res = []
-    for a in digits:
-        for b in digits:
-            if b == a:
-                continue
-            for c in digits:
-                if c == a or c == b:
-                    continue
-                res.append(a*100 + b*10 + c)
+    res = np.concatenate(list(k_permutation_numbers([1, 2, 3, 4], 3))).tolist()
     print("【1】1/2/3/4 能组成的无重复三位数：")
     print(res)
     print("共 {} 个\n".format(len(res)))
 
+# 原来的嵌套循环写法推广到任意 k（k 层循环用递归表示），一次性建好整个列表，留作基准对比
+def k_permutations_loops(digits, k):
+    res = []
+    def loop(prefix, value):
+        if len(prefix) == k:
+            res.append(value)
+            return
+        for d in digits:
+            if d in prefix:
+                continue
+            loop(prefix + [d], value * 10 + d)
+    loop([], 0)
+    return res
+
+# n 个不同数字取 k 个的排列数 n!/(n-k)!，不用枚举
+def count_k_permutations(digits, k):
+    return math.perm(len(set(digits)), k)
+
+# 第 i 位在字典序里的“权”：固定前 i+1 位后，剩下位置的排列数
+def _perm_weights(n, k):
+    return [math.perm(n - 1 - i, k - 1 - i) for i in range(k)]
+
+# 字典序第 r 个（从 0 起）k-排列：第 i 位取剩余数字中第 r // w_i % (n-i) 个
+def unrank_k_permutation(digits, k, r):
+    rest = sorted(set(digits))
+    if not 0 <= r < math.perm(len(rest), k):
+        raise IndexError("排名超出范围")
+    out = []
+    for w in _perm_weights(len(rest), k):
+        out.append(rest.pop(r // w % len(rest)))
+    return tuple(out)
+
+# unrank 的逆：给出一个 k-排列在字典序里的排名
+def rank_k_permutation(digits, k, perm):
+    rest = sorted(set(digits))
+    if len(perm) != k:
+        raise ValueError("排列长度与 k 不一致")
+    if k > len(rest):
+        raise ValueError("排列长度超过不同数字的个数")
+    r = 0
+    for w, d in zip(_perm_weights(len(rest), k), perm):
+        i = rest.index(d)  # 数字不在剩余集合里（不属于 digits 或重复）时抛 ValueError
+        r += i * w
+        rest.pop(i)
+    return r
+
+# 按块产出字典序排名 [start, stop) 的 k-排列在排好序的数字里的下标，每块是 (k, m) 数组（按位置存放，每行连续）。
+# 每一列先按 unrank 的方式算出各位在“剩余数字”里的下标，再从右往左把下标还原成在全部数字里的下标
+# （位置 j 在 i 之后且下标 >= 位置 i 的下标时加一），整块只需 k(k-1)/2 次向量运算。
+# 排名放得进 int32 时用 int32 做除法，下标用 int8/int16，都比 int64 快得多
+def _k_permutation_index_blocks(n, k, start, stop, block):
+    if start < 0:
+        raise IndexError("起始排名不能为负")
+    total = math.perm(n, k)
+    if total == 0:  # k 大于不同数字的个数：没有这样的排列
+        return
+    if total >= 2 ** 63:
+        raise OverflowError("排列数超出 int64，请用 unrank_k_permutation 逐个生成")
+    stop = total if stop is None else min(stop, total)
+    rank_dtype = np.int32 if stop < 2 ** 31 else np.int64
+    idx_dtype = np.int8 if n <= 127 else np.int16 if n <= 32767 else np.int64
+    weights = _perm_weights(n, k)
+    for lo in range(start, stop, block):
+        r = np.arange(lo, min(lo + block, stop), dtype=rank_dtype)
+        idx = np.empty((k, len(r)), dtype=idx_dtype)
+        for i, w in enumerate(weights):
+            idx[i] = r // min(w, stop) % (n - i)  # w >= stop 时商恒为 0，截断免得 w 超出 int32
+        for i in range(k - 2, -1, -1):
+            tail = idx[i + 1:]
+            tail += tail >= idx[i]
+        yield idx
+
+# 按块产出字典序排名 [start, stop) 的 k-排列，每块是 (m, k) 数组，每行一个排列。
+# 不同进程取不相交的 [start, stop) 即可分片，拼起来与整体枚举完全一致
+def k_permutation_blocks(digits, k, start=0, stop=None, block=PERM_BLOCK):
+    values = np.array(sorted(set(digits)))
+    for idx in _k_permutation_index_blocks(len(values), k, start, stop, block):
+        yield values[idx].T
+
+# 把每行数字拼成 k 位整数（字典序即从小到大）；digits 含 0 时首位为 0 的是 k-1 位数，需要时按 num >= 10**(k-1) 筛掉
+def k_permutation_numbers(digits, k, start=0, stop=None, block=PERM_BLOCK):
+    values = np.array(sorted(set(digits)), dtype=np.int64)
+    for idx in _k_permutation_index_blocks(len(values), k, start, stop, block):
+        nums = np.zeros(idx.shape[1], dtype=np.int64)
+        for row in idx:
+            nums *= 10
+            nums += values[row]
+        yield nums
+
+# 逐个惰性产出元组；内部仍按小块向量化生成
+def iter_k_permutations(digits, k, start=0, stop=None, block=4096):
+    for blk in k_permutation_blocks(digits, k, start, stop, block):
+        yield from map(tuple, blk.tolist())
+
+# 把 [0, 总数) 均分成 parts 段排名区间，交给各进程分别调用 k_permutation_blocks
+def k_permutation_shards(digits, k, parts):
+    total = count_k_permutations(digits, k)
+    bounds = [total * i // parts for i in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
 # ---------- 功能 2：101-200 之间的素数 ----------
 def primes_101_200():
+    primes = primes_in_range(101, 201).tolist()
+    print("【2】101–200 之间的素数：")
+    print(primes)
+    print("共 {} 个\n".format(len(primes)))
+
+# 原来的逐个试除写法，留作基准对比
+def primes_trial(lo, hi):
     primes = []
-    for n in range(101, 201):
+    for n in range(max(lo, 2), hi):
         is_p = True
         for d in range(2, int(math.isqrt(n)) + 1):
             if n % d == 0:
@@ -28,41 +141,410 @@ def primes_101_200():
                 break
         if is_p:
             primes.append(n)
-    print("【2】101–200 之间的素数：")
-    print(primes)
-    print("共 {} 个\n".format(len(primes)))
+    return primes
+
+# 普通埃氏筛：[0, n] 内全部素数
+def small_primes(n):
+    if n < 2:
+        return np.empty(0, np.int64)
+    sieve = np.ones(n + 1, dtype=bool)
+    sieve[:2] = False
+    for i in range(2, math.isqrt(n) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = False
+    return np.flatnonzero(sieve)
+
+# 分段埃氏筛：逐段产出 [lo, hi) 内的素数数组，每段只筛 segment_size 个奇数，内存与区间长度无关
+def iter_primes(lo, hi, segment_size=SEGMENT_SIZE):
+    lo = max(lo, 2)
+    if hi <= lo:
+        return
+    if lo == 2:
+        yield np.array([2], dtype=np.int64)
+    base = small_primes(math.isqrt(hi - 1))[1:].tolist()  # 奇素数；转成 Python int 免得逐个取 NumPy 标量
+    start = max(3, lo | 1)  # 第一个不小于 lo 的奇数
+    for seg_lo in range(start, hi, 2 * segment_size):
+        seg_hi = min(seg_lo + 2 * segment_size, hi)
+        sieve = np.ones((seg_hi - seg_lo + 1) // 2, dtype=bool)  # 第 i 位对应奇数 seg_lo + 2i
+        for p in base:
+            if p * p >= seg_hi:
+                break
+            m = max(p * p, (seg_lo + p - 1) // p * p)
+            if m % 2 == 0:
+                m += p  # 只标记奇数倍
+            sieve[(m - seg_lo) // 2::p] = False
+        yield seg_lo + 2 * np.flatnonzero(sieve).astype(np.int64)
+
+def primes_in_range(lo, hi, segment_size=SEGMENT_SIZE):
+    segments = list(iter_primes(lo, hi, segment_size))
+    return np.concatenate(segments) if segments else np.empty(0, np.int64)
+
+# 只计数不保存，10^9 级区间也不占内存
+def count_primes(lo, hi, segment_size=SEGMENT_SIZE):
+    return sum(len(seg) for seg in iter_primes(lo, hi, segment_size))
 
 # ---------- 功能 3：正整数分解质因数 ----------
 def factorize():
     n = int(input("【3】请输入一个正整数："))
     print(f"{n}=", end="")
+    print("*".join(str(p) for p in factor(n)) if n > 1 else "", end="")
+    print("\n")
+
+# 原来的试除写法，返回质因数列表，留作基准对比
+def factorize_trial(n):
+    factors = []
     tmp = n
-    first = True
     for p in range(2, int(math.isqrt(n)) + 1):
         while tmp % p == 0:
-            if not first:
-                print("*", end="")
-            print(p, end="")
-            first = False
+            factors.append(p)
             tmp //= p
     if tmp > 1:
-        if not first:
-            print("*", end="")
-        print(tmp, end="")
-    print("\n")
+        factors.append(tmp)
+    return factors
+
+# 最小质因子表：spf[i] 为 i 的最小质因子（i >= 2）
+def spf_table(n):
+    spf = np.zeros(n + 1, dtype=np.int32 if n < 2 ** 31 else np.int64)
+    for p in small_primes(math.isqrt(n)).tolist():
+        view = spf[p * p::p]
+        view[view == 0] = p
+    rest = np.flatnonzero(spf == 0)
+    spf[rest] = rest  # 没被标记的是素数本身
+    spf[:2] = 0
+    return spf
+
+# 用最小质因子表批量分解许多小数：所有数同时除以各自的最小质因子，循环次数只与最大的质因数个数有关
+def factorize_many(values, spf=None):
+    values = np.asarray(values, dtype=np.int64)
+    if spf is None:
+        spf = spf_table(int(values.max()) if values.size else 1)
+    owners = np.flatnonzero(values > 1)
+    cur = values[owners]
+    found_owner, found_p = [], []
+    while cur.size:
+        p = spf[cur].astype(np.int64)
+        found_owner.append(owners)
+        found_p.append(p)
+        cur = cur // p
+        keep = cur > 1
+        cur, owners = cur[keep], owners[keep]
+    result = [[] for _ in range(len(values))]
+    if found_owner:
+        owner = np.concatenate(found_owner)
+        primes = np.concatenate(found_p)
+        order = np.argsort(owner, kind='stable')  # 同一个数的因子按找到的先后（即从小到大）排列
+        counts = np.bincount(owner, minlength=len(values))
+        for i, chunk in zip(np.flatnonzero(counts), np.split(primes[order], np.cumsum(counts[counts > 0])[:-1])):
+            result[i] = chunk.tolist()
+    return result
+
+# Miller-Rabin 素性检验（用 MR_BASES 作底，对 64 位整数是确定性的）
+def is_prime(n):
+    if n < 2:
+        return False
+    for p in MR_BASES:
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for a in MR_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+# Pollard-rho（Brent 版，按批累乘后再求 gcd），返回 n 的一个非平凡因子；n 须为合数
+def pollard_rho(n):
+    if n % 2 == 0:
+        return 2
+    while True:
+        y, c, m = random.randrange(1, n), random.randrange(1, n), 128
+        g = r = q = 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = math.gcd(q, n)
+                k += m
+            r *= 2
+        if g == n:  # 批量累乘越过了因子，逐步回退
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = math.gcd(abs(x - ys), n)
+        if g != n:
+            return g
+
+_SMALL_PRIMES = small_primes(SMALL_PRIME_LIMIT).tolist()
+
+# 分解任意正整数（含 64 位大数）：小素数试除 + Miller-Rabin + Pollard-rho，返回从小到大的质因数列表
+def factor(n):
+    if n < 1:
+        raise ValueError("只能分解正整数")
+    factors = []
+    for p in _SMALL_PRIMES:
+        if p * p > n:
+            break
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+    stack = [n] if n > 1 else []
+    while stack:
+        m = stack.pop()
+        if m < SMALL_PRIME_LIMIT ** 2 or is_prime(m):  # 小素数试除后剩下的 < 1000^2 的数必为素数
+            factors.append(m)
+        else:
+            d = pollard_rho(m)
+            stack += [d, m // d]
+    return sorted(factors)
+
+# ---------- 基准对比 ----------
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+def benchmark_primes(lo=10 ** 6, hi=12 * 10 ** 5, segment_size=SEGMENT_SIZE):
+    trial, t_trial = _timed(primes_trial, lo, hi)
+    sieve, t_sieve = _timed(primes_in_range, lo, hi, segment_size)
+    assert trial == sieve.tolist()
+    print(f"[{lo}, {hi}) 共 {len(trial)} 个素数：试除 {t_trial:.3f}s，分段筛 {t_sieve:.3f}s，"
+          f"加速 {t_trial / t_sieve:.0f}x")
+
+def benchmark_factorize(count=10 ** 5, max_value=10 ** 7, big=(2 ** 61 - 1) * 1000003, seed=0):
+    rng = random.Random(seed)
+    values = [rng.randrange(2, max_value + 1) for _ in range(count)]
+    trial, t_trial = _timed(lambda: [factorize_trial(v) for v in values])
+    spf, t_spf = _timed(spf_table, max_value)
+    batch, t_batch = _timed(factorize_many, values, spf)
+    rho, t_rho = _timed(lambda: [factor(v) for v in values])
+    assert trial == batch == rho
+    print(f"{count} 个不超过 {max_value} 的数：试除 {t_trial:.3f}s，"
+          f"最小质因子表 建表 {t_spf:.3f}s + 分解 {t_batch:.3f}s，逐个 factor {t_rho:.3f}s")
+    big_factors, t_big = _timed(factor, big)
+    assert math.prod(big_factors) == big and all(is_prime(p) for p in big_factors)
+    print(f"{big} = {'*'.join(map(str, big_factors))}：Pollard-rho {t_big * 1000:.1f} ms（试除需约 isqrt(n) 次除法）")
+
+def benchmark_center(sizes=(10 ** 6, 10 ** 7, 10 ** 8), dtypes=(np.int32, np.float32), out_dtype=np.float64,
+                     list_limit=10 ** 7, workdir=None, block=CENTER_BLOCK):
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n, dtype in itertools.product(sizes, dtypes):
+            src, dst = os.path.join(tmp, "src.bin"), os.path.join(tmp, "dst.bin")
+            random_values_file(src, n, dtype, block=block)
+            line = f"n={n:.0e} {np.dtype(dtype).name}->{np.dtype(out_dtype).name}："
+            if n <= list_limit:  # 列表写法每个元素约 28 + 8 字节，再大就放不下内存了
+                values = np.fromfile(src, dtype=dtype)
+                data = values.tolist()
+                ref, t_list = _timed(minus_mean_list, data)
+                (arr, mean, _), t_arr = _timed(center, values, None, out_dtype, block)
+                # 均值与 math.fsum 的正确舍入结果一致（生成的数据块内求和无舍入）；整数输入时 float64 下的
+                # x - mean 与列表写法逐位相同；每个输出都是它转成输出类型的结果
+                assert mean == math.fsum(data) / n
+                exact = values.astype(np.float64) - mean
+                if np.issubdtype(dtype, np.integer):
+                    assert np.array_equal(exact, np.asarray(ref))
+                if np.issubdtype(out_dtype, np.integer):
+                    exact = np.rint(exact)
+                assert np.array_equal(arr, exact.astype(out_dtype))
+                del data, ref, exact, arr, values
+                line += f"列表 {t_list:.2f}s，内存数组 {t_arr:.2f}s，"
+            (mean, residual), t_file = _timed(center_file, src, dtype, dst, out_dtype, block)
+            rate = n * (np.dtype(dtype).itemsize + np.dtype(out_dtype).itemsize) / t_file / 2 ** 20
+            print(line + f"memmap 文件 {t_file:.2f}s（{rate:.0f} MiB/s），均值 {mean:.6f}，"
+                  f"残差/n {residual / n:.1e}")
+            os.remove(src)
+            os.remove(dst)
+
+def benchmark_permutations(digits=tuple(range(10)), k=7, block=PERM_BLOCK, shards=4):
+    digits = tuple(sorted(set(digits)))  # 嵌套循环与 itertools 按输入顺序枚举，排好序才是字典序
+    loops, t_loops = _timed(k_permutations_loops, list(digits), k)
+    tools, t_tools = _timed(lambda: [int("".join(map(str, p))) for p in itertools.permutations(digits, k)])
+    blocks, t_blocks = _timed(lambda: np.concatenate(list(k_permutation_numbers(digits, k, block=block))))
+    total, t_count = _timed(count_k_permutations, digits, k)
+    assert loops == tools == blocks.tolist() and total == len(loops)
+    parts = [np.concatenate(list(k_permutation_numbers(digits, k, a, b, block)))
+             for a, b in k_permutation_shards(digits, k, shards)]
+    assert np.array_equal(np.concatenate(parts), blocks)
+    probe = [0, total // 3, total - 1]
+    assert all(unrank_k_permutation(digits, k, r) == tuple(int(c) for c in str(loops[r]).zfill(k)) and
+               rank_k_permutation(digits, k, unrank_k_permutation(digits, k, r)) == r for r in probe)
+    print(f"n={len(digits)}, k={k} 共 {total} 个（组合公式 {t_count * 1e6:.1f} µs）：嵌套循环 {t_loops:.2f}s，"
+          f"itertools {t_tools:.2f}s，NumPy 分块 {t_blocks:.3f}s（加速 {t_loops / t_blocks:.0f}x），"
+          f"{shards} 段分片拼接一致")
 
 # ---------- 功能 4：随机 30 整数，减均值 ----------
 def random_minus_mean():
     data = [random.randint(0, 99) for _ in range(30)]
     mean = sum(data) / len(data)
-    minus = [x - mean for x in data]
+    minus = minus_mean_list(data)
     print("【4】随机生成的 30 个整数：")
     print(data)
     print("均值 = {:.2f}".format(mean))
     print("每个元素减去均值后的列表：")
     print(minus)
 
-if __name__ == "__main__":
+# 原来的列表写法，留作基准对比
+def minus_mean_list(data):
+    mean = sum(data) / len(data)
+    return [x - mean for x in data]
+
+# 第一遍：分块求均值。不超过 32 位的整数按块用 int64 精确求和、块间用 Python int 累加，
+# 均值 = 精确总和 / n，是真值的正确舍入；浮点数块内 float64 成对求和、块间 math.fsum 精确累加，
+# 相对误差约 log2(block) * 2^-53 * sum(|x|) / |sum(x)|，与总元素个数无关
+def streaming_mean(data, block=CENTER_BLOCK):
+    n = len(data)
+    if n == 0:
+        raise ValueError("空数据没有均值")
+    exact = np.issubdtype(data.dtype, np.integer) and data.dtype.itemsize <= 4
+    sums = []
+    for i in range(0, n, block):
+        chunk = data[i:i + block]
+        sums.append(int(chunk.sum(dtype=np.int64)) if exact else float(chunk.sum(dtype=np.float64)))
+    return sum(sums) / n if exact else math.fsum(sums) / n
+
+# 第二遍：分块写出 x - mean。out 为 None 时新建 out_dtype 数组，传入 data 本身即原地改写；
+# 每块先在 float64 下相减再转成 out 的类型（整数类型用 np.rint 就近取整，.5 取偶），所以每个输出都是 float64 结果的正确舍入。
+# 顺带累加残差 sum(x - mean)，它相对 sum(|x|) 应在 1e-15 量级，可作为精度检查
+def center(data, out=None, out_dtype=np.float64, block=CENTER_BLOCK):
+    mean = streaming_mean(data, block)
+    if out is None:
+        out = np.empty(len(data), dtype=out_dtype)
+    if len(out) != len(data):
+        raise ValueError("输出长度与输入不一致")
+    integral = np.issubdtype(out.dtype, np.integer)
+    residual = []
+    tmp = np.empty(min(block, len(data)), dtype=np.float64)
+    for i in range(0, len(data), block):
+        t = tmp[:len(data[i:i + block])]
+        np.subtract(data[i:i + block], mean, out=t, dtype=np.float64)  # 不指定时 float32 输入会把 mean 舍入成 float32 再相减
+        residual.append(float(t.sum()))
+        if integral:
+            np.rint(t, out=t)
+        out[i:i + block] = t
+    return out, mean, math.fsum(residual)
+
+# 对磁盘上的原始二进制数组（np.memmap）减均值：out_path 为 None 时原地写回（输出类型只能与源相同），
+# 否则新建 out_dtype 的 memmap 输出文件。两遍都是顺序读写，内存只有一个块
+def center_file(path, dtype=np.int32, out_path=None, out_dtype=None, block=CENTER_BLOCK):
+    dtype = np.dtype(dtype)
+    if out_path is None:
+        if out_dtype is not None and np.dtype(out_dtype) != dtype:
+            raise ValueError("原地写回时输出类型必须与源文件一致")
+        data = np.memmap(path, dtype=dtype, mode='r+')
+        out = data
+    else:
+        data = np.memmap(path, dtype=dtype, mode='r')
+        out = np.memmap(out_path, dtype=out_dtype or np.float64, mode='w+', shape=data.shape)
+    out, mean, residual = center(data, out, block=block)
+    out.flush()
+    return mean, residual
+
+# 分块生成 n 个随机数写成原始二进制文件，供大数据量基准使用：整数类型取 [0, 99]，
+# 浮点类型取 1000 附近的正态值（均值远大于离散程度，float32 下先舍入 mean 再相减的误差会很明显）
+def random_values_file(path, n, dtype=np.int32, seed=0, block=CENTER_BLOCK):
+    rng = np.random.default_rng(seed)
+    data = np.memmap(path, dtype=dtype, mode='w+', shape=(n,))
+    for i in range(0, n, block):
+        m = min(block, n - i)
+        data[i:i + block] = rng.integers(0, 100, size=m, dtype=dtype) if np.issubdtype(dtype, np.integer) \
+            else 1000 + rng.standard_normal(m)
+    data.flush()
+    del data
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="作业2：无重复数字排列、素数区间、质因数分解、流式减均值与基准对比")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("primes", help="输出或统计 [lo, hi) 内的素数")
+    p.add_argument("lo", type=int)
+    p.add_argument("hi", type=int)
+    p.add_argument("--count-only", action="store_true", help="只计数（大区间时用）")
+    p.add_argument("--segment", type=int, default=SEGMENT_SIZE, help="分段筛每段的奇数个数")
+    p = sub.add_parser("factor", help="分解若干正整数（支持 64 位大数）")
+    p.add_argument("values", type=int, nargs="+")
+    p = sub.add_parser("bench-primes", help="分段筛与逐个试除的对比")
+    p.add_argument("--lo", type=int, default=10 ** 6)
+    p.add_argument("--hi", type=int, default=12 * 10 ** 5)
+    p.add_argument("--segment", type=int, default=SEGMENT_SIZE)
+    p = sub.add_parser("bench-factor", help="最小质因子表、Pollard-rho 与试除分解的对比")
+    p.add_argument("--count", type=int, default=10 ** 5, help="随机数个数")
+    p.add_argument("--max-value", type=int, default=10 ** 7, help="随机数上界")
+    p.add_argument("--big", type=int, default=(2 ** 61 - 1) * 1000003, help="单独用 Pollard-rho 分解的大数")
+    p = sub.add_parser("perms", help="按字典序输出由给定数字组成的无重复 k 位数")
+    p.add_argument("k", type=int)
+    p.add_argument("--digits", default="1234", help="可用数字，如 0123456789")
+    p.add_argument("--start", type=int, default=0, help="起始排名（含），用于分片")
+    p.add_argument("--stop", type=int, help="结束排名（不含）")
+    p.add_argument("--count-only", action="store_true", help="只输出总数")
+    p.add_argument("--rank", help="输出这个 k 位数在字典序里的排名")
+    p = sub.add_parser("bench-perms", help="NumPy 分块生成与嵌套循环的对比")
+    p.add_argument("--digits", default="0123456789")
+    p.add_argument("-k", type=int, default=7)
+    p.add_argument("--block", type=int, default=PERM_BLOCK)
+    p = sub.add_parser("center", help="对原始二进制数组文件分块减均值（np.memmap，两遍顺序读写）")
+    p.add_argument("path")
+    p.add_argument("--dtype", default="int32", help="源文件元素类型")
+    p.add_argument("-o", "--out", help="输出文件；省略则原地写回")
+    p.add_argument("--out-dtype", choices=["int32", "float32", "float64"], help="输出类型，默认 float64（原地时与源相同）")
+    p.add_argument("--block", type=int, default=CENTER_BLOCK, help="每块元素个数")
+    p = sub.add_parser("bench-center", help="流式减均值与列表写法的对比")
+    p.add_argument("--sizes", type=float, nargs="+", default=[1e6, 1e7, 1e8], help="元素个数，如 1e6 1e9")
+    p.add_argument("--dtypes", nargs="+", default=["int32", "float32"], help="源数据类型，逐个测试")
+    p.add_argument("--out-dtype", choices=["int32", "float32", "float64"], default="float64")
+    p.add_argument("--list-limit", type=float, default=1e7, help="超过该规模不再跑列表写法")
+    p.add_argument("--workdir", help="临时文件目录（10^9 个 int32 + float64 约需 12 GB）")
+    p.add_argument("--block", type=int, default=CENTER_BLOCK)
+    args = parser.parse_args()
+
+    if args.cmd == "primes":
+        if args.count_only:
+            t0 = time.perf_counter()
+            print(f"[{args.lo}, {args.hi}) 共 {count_primes(args.lo, args.hi, args.segment)} 个素数"
+                  f"（{time.perf_counter() - t0:.2f}s）")
+        else:
+            for seg in iter_primes(args.lo, args.hi, args.segment):
+                print("\n".join(map(str, seg.tolist())))
+    elif args.cmd == "factor":
+        for v in args.values:
+            print(f"{v}={'*'.join(map(str, factor(v))) if v > 1 else ''}")
+    elif args.cmd == "bench-primes":
+        benchmark_primes(args.lo, args.hi, args.segment)
+    elif args.cmd == "bench-factor":
+        benchmark_factorize(args.count, args.max_value, args.big)
+    elif args.cmd == "perms":
+        digits = [int(c) for c in args.digits]
+        if args.count_only:
+            print(count_k_permutations(digits, args.k))
+        elif args.rank:
+            print(rank_k_permutation(digits, args.k, [int(c) for c in args.rank]))
+        else:
+            for nums in k_permutation_numbers(digits, args.k, args.start, args.stop):
+                print("\n".join(str(v).zfill(args.k) for v in nums.tolist()))
+    elif args.cmd == "bench-perms":
+        benchmark_permutations(tuple(int(c) for c in args.digits), args.k, args.block)
+    elif args.cmd == "center":
+        (mean, residual), t = _timed(center_file, args.path, args.dtype, args.out, args.out_dtype, args.block)
+        print(f"均值 = {mean!r}，残差 sum(x - mean) = {residual:.3e}（{t:.2f}s）")
+    else:
+        benchmark_center([int(n) for n in args.sizes], args.dtypes, args.out_dtype,
+                         int(args.list_limit), args.workdir, args.block)
+
+elif __name__ == "__main__":
     tmp = ''
     tmp = input(''' 2025/10/09 作业2 如下：
         1. 有四个数字：1、2、3、4，能组成多少个互不相同且无重复数字的三位数？各是多少？\n
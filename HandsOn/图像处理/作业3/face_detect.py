@@ -0,0 +1,144 @@
+# face_detect.py
+# 作业3-1（人脸比对）与 作业3-2（人脸检测 GUI）共用的多人脸、多尺度检测
+import cv2
+import numpy as np
+import time
+
+# ---------- 可调参数 ----------
+HAAR_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+DETECT_MAX_SIDE = 1024  # 级联在长边不超过该值的缩小图上运行；更小的图不缩放，结果与原图直接检测一致
+VERIFY_MARGIN = 0.25  # 原图复核时 ROI 向外扩展的比例
+ROI_MARGIN = 0.1  # 交给 ORB 的人脸 ROI 向外扩展的比例
+# ------------------------------
+
+# 加载人脸检测器
+face_cascade = cv2.CascadeClassifier(HAAR_PATH)
+
+
+def detect_faces(gray, scaleFactor=1.1, minNeighbors=3, minSize=(30, 30),
+                 max_side=DETECT_MAX_SIDE, verify=False, cascade=None):
+    """多人脸检测，返回原图坐标下的 (N, 4) int 数组 [x, y, w, h]
+
+    长边超过 max_side 时先按 INTER_AREA 缩小再跑级联，框按比例映射回原图；
+    minSize 同步缩小（级联窗口最小 24 像素，缩小后比 24/scale 更小的脸检测不到）。
+    verify=True 时对每个框在原图上取扩展 VERIFY_MARGIN 的小 ROI 复核：
+    复核到人脸则用原图结果修正框位置，否则丢弃该框。
+    """
+    cascade = cascade or face_cascade
+    h, w = gray.shape[:2]
+    scale = min(1.0, max_side / max(h, w)) if max_side else 1.0
+    if scale < 1.0:
+        small = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        small_min = (max(1, round(minSize[0] * scale)), max(1, round(minSize[1] * scale)))
+    else:
+        small, small_min = gray, minSize
+    faces = cascade.detectMultiScale(small, scaleFactor=scaleFactor, minNeighbors=minNeighbors,
+                                     minSize=small_min, flags=cv2.CASCADE_SCALE_IMAGE)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 4)
+    if scale < 1.0 and len(faces):
+        faces = np.round(faces / scale).astype(np.int64)
+        faces[:, 2] = np.minimum(faces[:, 2], w - faces[:, 0])
+        faces[:, 3] = np.minimum(faces[:, 3], h - faces[:, 1])
+    if verify and scale < 1.0:
+        faces = _verify_faces(gray, faces, scaleFactor, minNeighbors, cascade)
+    return faces
+
+
+def _verify_faces(gray, faces, scaleFactor, minNeighbors, cascade):
+    """在原图的小 ROI 内复核每个框，只在与缩小图检测尺寸相近的窗口范围内搜索"""
+    kept = []
+    for box in faces:
+        x0, y0, x1, y1 = _expand(box, gray.shape, VERIFY_MARGIN)
+        side = int(min(box[2], box[3]))
+        found = cascade.detectMultiScale(gray[y0:y1, x0:x1], scaleFactor=scaleFactor,
+                                         minNeighbors=minNeighbors,
+                                         minSize=(int(side * 0.7),) * 2, maxSize=(int(side * 1.4),) * 2)
+        if len(found):
+            fx, fy, fw, fh = max(found, key=lambda r: r[2] * r[3])
+            kept.append((x0 + fx, y0 + fy, fw, fh))
+    return np.asarray(kept, dtype=np.int64).reshape(-1, 4)
+
+
+def _expand(box, shape, margin):
+    """框向外扩展 min(w, h) * margin，裁到图像范围内，返回 (x0, y0, x1, y1)
+
+    与原 detect_face_roi 的裁剪方式一致：左/上被截断时，宽高仍按 w + 2*margin 计。
+    """
+    x, y, w, h = (int(v) for v in box)
+    m = int(min(w, h) * margin)
+    x0, y0 = max(0, x - m), max(0, y - m)
+    return x0, y0, x0 + min(shape[1] - x0, w + 2 * m), y0 + min(shape[0] - y0, h + 2 * m)
+
+
+def face_rois(gray, faces, margin=ROI_MARGIN):
+    """按检测框取出扩展后的人脸 ROI 列表（原图视图，不复制），供 ORB 提取特征"""
+    rois = []
+    for box in faces:
+        x0, y0, x1, y1 = _expand(box, gray.shape, margin)
+        rois.append(gray[y0:y1, x0:x1])
+    return rois
+
+
+def largest_face(faces):
+    """面积最大的框的下标，没有框时为 None"""
+    if len(faces) == 0:
+        return None
+    return int(np.argmax(faces[:, 2] * faces[:, 3]))
+
+
+def draw_faces(img, faces, label='Face'):
+    """在图像上原地画框和标签"""
+    for (x, y, w, h) in faces:
+        cv2.rectangle(img, (int(x), int(y)), (int(x + w), int(y + h)), (0, 255, 0), 2)
+        cv2.putText(img, label, (int(x), int(y) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+    return img
+
+
+def _iou(a, b):
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    return inter / float(a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def benchmark_detection(gray_images, max_side=DETECT_MAX_SIDE, verify=True, **params):
+    """对比原图直接 detectMultiScale 与缩小图检测（+ 原图复核）的耗时与结果
+
+    统计缩小检测的框中有多少与原图检测的某个框 IoU >= 0.5。原图检测在大脸内部常有额外的小框，
+    所以原图框数多于缩小检测并不说明漏检。
+    """
+    rows = []
+    for k, gray in enumerate(gray_images):
+        t0 = time.perf_counter()
+        full = detect_faces(gray, max_side=None, **params)
+        t1 = time.perf_counter()
+        fast = detect_faces(gray, max_side=max_side, verify=verify, **params)
+        t2 = time.perf_counter()
+        hit = sum(any(_iou(f, g) >= 0.5 for g in full) for f in fast)
+        rows.append((k, gray.shape, t1 - t0, t2 - t1, len(full), len(fast), hit))
+        print(f"图{k}: {gray.shape[1]}x{gray.shape[0]}  原图 {t1 - t0:.3f}s / {len(full)} 张脸"
+              f"  缩小{'+复核' if verify else ''} {t2 - t1:.3f}s / {len(fast)} 张脸"
+              f"  与原图框对上 {hit}/{len(fast)}  加速 {(t1 - t0) / max(t2 - t1, 1e-9):.1f}x")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多人脸、多尺度检测与耗时对比")
+    parser.add_argument("images", nargs="+", help="图像路径")
+    parser.add_argument("--max-side", type=int, default=DETECT_MAX_SIDE, help="级联运行的缩小图长边")
+    parser.add_argument("--no-verify", action="store_true", help="不在原图小 ROI 内复核")
+    parser.add_argument("--scale-factor", type=float, default=1.1)
+    parser.add_argument("--min-neighbors", type=int, default=3)
+    args = parser.parse_args()
+
+    grays = []
+    for path in args.images:
+        img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise FileNotFoundError(f"图片读取失败，请检查路径: {path}")
+        grays.append(img)
+    benchmark_detection(grays, max_side=args.max_side, verify=not args.no_verify,
+                        scaleFactor=args.scale_factor, minNeighbors=args.min_neighbors)
@@ -2,15 +2,26 @@ import cv2
 import numpy as np
 import os
 import glob
+import hashlib
+import itertools
+import json
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import face_detect
+from face_detect import detect_faces, face_rois, largest_face
 
 # ---------- 可调参数 ----------
 MATCH_RATIO = 0.75  # Lowe's ratio阈值（略微放宽）
 MIN_MATCH_COUNT = 15  # 最小匹配点数阈值
 MATCH_RATE_THRESHOLD = 0.12  # 匹配率阈值
-HAAR_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+SIGNATURE_SIZE = 64  # 全局签名：ROI 缩放到的边长
+SIGNATURE_GRID = 4  # 全局签名：LBP 直方图的网格数（每边）
+DETECT_PARAMS = dict(scaleFactor=1.1, minNeighbors=3, minSize=(30, 30))  # 降低scaleFactor提高检测精度，降低minNeighbors增加检测灵敏度
+FEATURE_CACHE_VERSION = 2  # 改动 ROI 预处理或特征提取的代码逻辑时加一，使旧的磁盘缓存失效
 # ------------------------------
 
-face_cascade = cv2.CascadeClassifier(HAAR_PATH)
 # 增强ORB特征提取器
 orb = cv2.ORB_create(
     nfeatures=1000,  # 增加特征点数量
@@ -26,30 +37,16 @@ bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
 
 
 def detect_face_roi(gray):
-    """优化的人脸ROI检测"""
-    faces = face_cascade.detectMultiScale(
-        gray,
-        scaleFactor=1.1,  # 降低scaleFactor提高检测精度
-        minNeighbors=3,  # 降低minNeighbors增加检测灵敏度
-        minSize=(30, 30),
-        flags=cv2.CASCADE_SCALE_IMAGE
-    )
-
-    if len(faces) == 0:
-        return None
+    """优化的人脸ROI检测：取面积最大的人脸，并扩展ROI区域以包含更多面部特征"""
+    faces = detect_faces(gray, **DETECT_PARAMS)
+    k = largest_face(faces)
+    return None if k is None else face_rois(gray, faces[k:k + 1])[0]
 
-    # 选择面积最大的人脸
-    x, y, w, h = max(faces, key=lambda rect: rect[2] * rect[3])
 
-    # 扩展ROI区域以包含更多面部特征
-    margin = int(min(w, h) * 0.1)
-    x = max(0, x - margin)
-    y = max(0, y - margin)
-    w = min(gray.shape[1] - x, w + 2 * margin)
-    h = min(gray.shape[0] - y, h + 2 * margin)
-
-    roi = gray[y:y + h, x:x + w]
-    return roi
+def detect_all_face_rois(gray, verify=False):
+    """检测图中所有人脸，返回 (框数组, ROI 列表)；大图在缩小图上检测，verify 时在原图小 ROI 内复核"""
+    faces = detect_faces(gray, verify=verify, **DETECT_PARAMS)
+    return faces, face_rois(gray, faces)
 
 
 def orb_features(roi):
@@ -70,13 +67,13 @@ def orb_features(roi):
     return kp, des
 
 
-def match_score(des1, des2):
-    """改进的匹配得分计算"""
+def match_score(des1, des2, matcher=None):
+    """改进的匹配得分计算；matcher 缺省为模块级 bf（多进程时每个进程传自己的 BFMatcher）"""
     if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
         return 0
 
     # 双向匹配确保准确性
-    matches = bf.knnMatch(des1, des2, k=2)
+    matches = (matcher or bf).knnMatch(des1, des2, k=2)
 
     # Lowe's ratio test
     good_count = 0
@@ -95,54 +92,545 @@ def match_score(des1, des2):
     return int(normalized_score)
 
 
-def compare_two_faces(path1, path2):
-    """优化的两张照片比较函数"""
-    img1 = cv2.imread(path1)
-    img2 = cv2.imread(path2)
-    if img1 is None or img2 is None:
-        raise FileNotFoundError("图片读取失败，请检查路径")
+# ------------------ NumPy 向量化匹配 ------------------
+def _unpack_bits(des):
+    """(N, 32) uint8 描述子 → (N, 256) float32 比特矩阵及每行比特数"""
+    bits = np.unpackbits(np.ascontiguousarray(des, dtype=np.uint8), axis=1).astype(np.float32)
+    return bits, bits.sum(axis=1)
+
+
+def hamming_matrix(des1, des2, block_cols=8192):
+    """两组二进制描述子之间的完整汉明距离矩阵 (n1, n2)，uint16
+
+    汉明距离 = popcount(a) + popcount(b) - 2·(a·b)，点积部分用 float32 矩阵乘（BLAS）完成，
+    每个元素不超过 256，float32 下是精确整数。按 block_cols 列分块以限制比特矩阵的临时内存。
+    """
+    bits1, pop1 = _unpack_bits(des1)
+    out = np.empty((len(des1), len(des2)), np.uint16)
+    for j in range(0, len(des2), block_cols):
+        bits2, pop2 = _unpack_bits(des2[j:j + block_cols])
+        dist = bits1 @ bits2.T
+        dist *= -2
+        dist += pop1[:, np.newaxis]
+        dist += pop2[np.newaxis, :]
+        out[:, j:j + len(bits2)] = dist
+    return out
+
 
-    gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+def _ratio_good_count(dist):
+    """每行取最近/次近（argpartition），返回满足 Lowe 比值检验的行数"""
+    idx = np.argpartition(dist, 1, axis=1)[:, :2]
+    two = np.take_along_axis(dist, idx, axis=1)
+    return int(np.count_nonzero(two[:, 0] < MATCH_RATIO * two[:, 1]))
 
-    roi1 = detect_face_roi(gray1)
-    roi2 = detect_face_roi(gray2)
-    if roi1 is None or roi2 is None:
+
+def match_score_np(des1, des2):
+    """与 match_score 结果一致的 NumPy 实现：一次算出汉明距离矩阵，比值检验写成数组表达式"""
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return 0
+    good_count = _ratio_good_count(hamming_matrix(des1, des2))
+    return int(good_count / min(len(des1), len(des2)) * 100)
+
+
+def match_scores_batch(des, galleries, max_cols=50000):
+    """一个查询对多个库描述子集一次性打分，返回与 [match_score(des, g) for g in galleries] 相同的数组
+
+    库描述子集首尾相接成一块，算一次 (n1, 总描述子数) 距离矩阵，
+    再用 reduceat 按段取最近/次近：次近 = 最近值出现不止一次时取最近值，否则取去掉最近值后的最小值。
+    每批最多拼接 max_cols 个库描述子以限制内存。
+    """
+    scores = np.zeros(len(galleries), np.int64)
+    if des is None or len(des) < 2:
+        return scores
+    valid = [i for i, g in enumerate(galleries) if g is not None and len(g) >= 2]
+    start = 0
+    while start < len(valid):
+        end, cols = start, 0
+        while end < len(valid) and (end == start or cols + len(galleries[valid[end]]) <= max_cols):
+            cols += len(galleries[valid[end]])
+            end += 1
+        ids = valid[start:end]
+        lens = np.array([len(galleries[i]) for i in ids])
+        offsets = np.concatenate(([0], np.cumsum(lens)[:-1]))
+        dist = hamming_matrix(des, np.concatenate([galleries[i] for i in ids]))
+        best = np.minimum.reduceat(dist, offsets, axis=1)
+        is_best = dist == np.repeat(best, lens, axis=1)
+        n_best = np.add.reduceat(is_best, offsets, axis=1, dtype=np.int32)
+        dist[is_best] = np.iinfo(np.uint16).max
+        second = np.where(n_best > 1, best, np.minimum.reduceat(dist, offsets, axis=1))
+        good = np.count_nonzero(best < MATCH_RATIO * second, axis=0)
+        scores[ids] = (good / np.minimum(len(des), lens) * 100).astype(np.int64)
+        start = end
+    return scores
+
+
+def benchmark_match(descriptors, repeat=3):
+    """对一组描述子比较 BFMatcher 与 NumPy 两条路径：先核对得分一致，再计时两两打分与一对多批量打分"""
+    descriptors = [d for d in descriptors if d is not None and len(d) >= 2]
+    if len(descriptors) < 2:
+        print("有效描述子不足两组")
+        return
+    pairs = [(a, b) for i, a in enumerate(descriptors) for b in descriptors[i + 1:]]
+    assert [match_score(a, b) for a, b in pairs] == [match_score_np(a, b) for a, b in pairs]
+    assert all(match_scores_batch(d, descriptors).tolist() == [match_score(d, g) for g in descriptors]
+               for d in descriptors)
+    for name, fn in (("BFMatcher 逐对", lambda: [match_score(a, b) for a, b in pairs]),
+                     ("NumPy 逐对", lambda: [match_score_np(a, b) for a, b in pairs]),
+                     ("NumPy 一对多", lambda: [match_scores_batch(d, descriptors) for d in descriptors])):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        print(f"{name:<14} {best * 1000:8.1f} ms")
+
+
+def read_gray(path):
+    """读图并转灰度，兼容中文路径"""
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"图片读取失败，请检查路径: {path}")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def extract_features(path):
+    """一次性完成 读图 → 人脸ROI → ORB，返回 (roi, des)；未检测到人脸时为 (None, None)"""
+    roi = detect_face_roi(read_gray(path))
+    if roi is None:
+        return None, None
+    _, des = orb_features(roi)
+    return roi, des
+
+
+def extract_all_features(path, verify=False):
+    """合照中每张人脸各自提取 ORB，返回 (框数组, 描述子列表)；描述子过少的脸也保留为 None"""
+    faces, rois = detect_all_face_rois(read_gray(path), verify)
+    return faces, [orb_features(roi)[1] for roi in rois]
+
+
+def feature_settings_digest():
+    """决定缓存 ROI 与描述子的全部设置（检测参数、缩小检测边长、ROI 扩展、ORB 参数、OpenCV 版本）的短摘要"""
+    settings = dict(version=FEATURE_CACHE_VERSION, cv2=cv2.__version__, detect=DETECT_PARAMS,
+                    cascade=os.path.basename(face_detect.HAAR_PATH), max_side=face_detect.DETECT_MAX_SIDE,
+                    roi_margin=face_detect.ROI_MARGIN,
+                    orb=[orb.getMaxFeatures(), orb.getScaleFactor(), orb.getNLevels(), orb.getEdgeThreshold(),
+                         orb.getFirstLevel(), orb.getWTA_K(), orb.getScoreType(), orb.getPatchSize()])
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class FeatureCache:
+    """每张图只检测、描述一次的特征缓存
+
+    内存中按路径缓存；给定 cache_dir 时再落盘为 .npz，文件名由图像内容的 SHA1 与特征设置的摘要组成：
+    图像内容改变、或检测/ORB 参数改变后自动失效，重命名/复制的相同图像也能命中。
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._mem = {}
+        self._settings = feature_settings_digest()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, path):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}_{self._settings}.npz")
+
+    def get(self, path):
+        """返回 (roi, des)，命中缓存时不再读图"""
+        key = os.path.abspath(path)
+        if key in self._mem:
+            return self._mem[key]
+
+        disk = self._disk_path(path) if self.cache_dir else None
+        if disk and os.path.exists(disk):
+            with np.load(disk) as z:
+                feats = (z['roi'], z['des']) if bool(z['has_face']) else (None, None)
+        else:
+            feats = extract_features(path)
+            if disk:
+                roi, des = feats
+                np.savez(disk, has_face=roi is not None,
+                         roi=roi if roi is not None else np.empty((0, 0), np.uint8),
+                         des=des if des is not None else np.empty((0, 32), np.uint8))
+        if feats[0] is not None and feats[1] is not None and len(feats[1]) == 0:
+            feats = (feats[0], None)  # 与 orb_features 一致：没有描述子时为 None
+        self._mem[key] = feats
+        return feats
+
+
+def compare_two_faces(path1, path2, cache=None, gallery=None):
+    """优化的两张照片比较函数；传入 FeatureCache 时复用已提取的特征
+
+    传入 FaceGallery 时，path1/path2 若是库中登记过的名字，直接读库里的描述子（memmap，不读图）。
+    """
+    feats = []
+    for path in (path1, path2):
+        i = gallery.find(path) if gallery is not None else None
+        if i is not None:
+            feats.append((True, gallery.descriptors(i)))
+        else:
+            roi, des = cache.get(path) if cache is not None else extract_features(path)
+            feats.append((roi is not None, des))
+    (has1, des1), (has2, des2) = feats
+    if not has1 or not has2:
         print("未检测到人脸，无法比对")
         return 0
 
-    _, des1 = orb_features(roi1)
-    _, des2 = orb_features(roi2)
     score = match_score(des1, des2)
     print("匹配得分：", score)
     return score
 
 
-def generate_match_matrix():
-    """自动生成当前目录下所有PNG图像的匹配度矩阵"""
-    # 查找当前目录下所有PNG格式的图像
-    image_files = sorted(glob.glob("*.PNG"))
-    if not image_files:
-        print("当前目录未找到.PNG图像文件")
-        return
-
-    print(f"找到 {len(image_files)} 个.PNG图像文件:")
-    for i, file in enumerate(image_files):
-        print(f"{i + 1}. {file}")
+# ------------------ 持久化人脸库 ------------------
+GALLERY_DESC_BYTES = 32  # ORB 描述子字节数
+
+
+class FaceGallery:
+    """磁盘上的人脸库：一个目录、三个只追加的文件
+
+    - descriptors.u8：所有人脸的 ORB 描述子首尾相接的 uint8 数据块，(总描述子数, 32)
+    - table.i64：每条登记一行 (起始行, 行数) 的 int64 表
+    - meta.jsonl：每条登记一行 JSON 元数据（至少有 name）
+
+    打开时只对前两个文件做 np.memmap，百万级人脸库也是瞬间打开、不占堆内存；元数据在第一次按名字查找时才读。
+    登记顺序为 数据块 → 元数据 → 表，以表的行数为准：中断时多写的尾巴在下次登记前截掉。
+    """
+    BLOB, TABLE, META = "descriptors.u8", "table.i64", "meta.jsonl"
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        for name in (self.BLOB, self.TABLE, self.META):
+            open(self._file(name), 'ab').close()
+        self._table = self._blob = self._meta = self._by_name = None
+        self._repaired = False
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _map(self, name, dtype, width):
+        rows = os.path.getsize(self._file(name)) // (np.dtype(dtype).itemsize * width)
+        if rows == 0:  # 空文件不能 memmap
+            return np.empty((0, width), dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode='r', shape=(rows, width))
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = self._map(self.TABLE, np.int64, 2)
+        return self._table
+
+    @property
+    def blob(self):
+        if self._blob is None:
+            self._blob = self._map(self.BLOB, np.uint8, GALLERY_DESC_BYTES)
+        return self._blob
+
+    def __len__(self):
+        return len(self.table)
+
+    def descriptors(self, i):
+        """第 i 条登记的描述子（memmap 视图，不复制）"""
+        start, count = self.table[i]
+        return self.blob[start:start + count]
+
+    def descriptor_list(self):
+        """全部条目的描述子视图列表，可直接交给 match_score / parallel_match_matrix / FaceIndex"""
+        return [self.descriptors(i) for i in range(len(self))]
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            with open(self._file(self.META), encoding='utf-8') as f:
+                self._meta = [json.loads(line) for line in itertools.islice(f, len(self))]
+        return self._meta
+
+    @property
+    def names(self):
+        return [m['name'] for m in self.meta]
+
+    def find(self, name):
+        """按名字查条目编号（同名多次登记时取最后一次），没有时为 None"""
+        if self._by_name is None:
+            self._by_name = {m['name']: i for i, m in enumerate(self.meta)}
+        return self._by_name.get(name)
+
+    def _repair(self):
+        """以表为准截掉上次中断时多写的数据块、半行表和多余的元数据行"""
+        n = len(self.table)
+        end = int(self.table[n - 1].sum()) if n else 0
+        with open(self._file(self.TABLE), 'rb+') as f:
+            f.truncate(n * 16)
+        with open(self._file(self.BLOB), 'rb+') as f:
+            f.truncate(end * GALLERY_DESC_BYTES)
+        with open(self._file(self.META), 'rb+') as f:
+            for _ in range(n):
+                f.readline()
+            f.truncate()
+        self._blob = None
+        self._repaired = True
+
+    def enroll(self, name, des, **meta):
+        """追加登记一张人脸，返回条目编号；des 为 None/过少时不登记并返回 None（与 FaceIndex.enroll 一致）"""
+        if des is None or len(des) < 2:
+            return None
+        if not self._repaired:
+            self._repair()
+        des = np.ascontiguousarray(des, dtype=np.uint8)
+        start = len(self.blob)
+        with open(self._file(self.BLOB), 'ab') as f:
+            f.write(des.tobytes())
+        record = {'name': name, **meta}
+        with open(self._file(self.META), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self._meta is not None:
+            self._meta.append(record)
+            if self._by_name is not None:
+                self._by_name[name] = len(self._meta) - 1
+        with open(self._file(self.TABLE), 'ab') as f:
+            f.write(np.array([start, len(des)], np.int64).tobytes())
+        self._table = self._blob = None  # 文件变长了，下次访问时重新映射
+        return len(self) - 1
+
+
+# ------------------ 全局签名预筛 ------------------
+def _uniform_lbp_table():
+    """8 邻域 LBP 码 → 59 个 uniform 模式编号（0/1 跳变不超过 2 次的 58 种各占一格，其余归入第 58 格）"""
+    table = np.full(256, 58, np.uint8)
+    k = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        if sum(bits[i] != bits[(i + 1) % 8] for i in range(8)) <= 2:
+            table[code] = k
+            k += 1
+    return table
+
+
+_LBP_TABLE = _uniform_lbp_table()
+_LBP_BINS = 59
+
+
+def face_signature(roi):
+    """人脸 ROI 的紧凑全局签名：均衡化后缩放到 SIGNATURE_SIZE，网格化 uniform LBP 直方图
+
+    直方图开方后做 L2 归一化（Hellinger 核），两张脸的签名距离 sqrt(2 - 2·内积) 在 [0, sqrt(2)]。
+    """
+    if roi is None:
+        return None
+    n = SIGNATURE_SIZE
+    img = cv2.resize(cv2.equalizeHist(roi), (n + 2, n + 2), interpolation=cv2.INTER_AREA).astype(np.int16)
+    center = img[1:-1, 1:-1]
+    code = np.zeros((n, n), np.uint8)
+    for bit, (dy, dx) in enumerate(((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))):
+        code |= (img[1 + dy:n + 1 + dy, 1 + dx:n + 1 + dx] >= center).astype(np.uint8) << bit
+    cell = np.arange(n) * SIGNATURE_GRID // n
+    cell_id = cell[:, np.newaxis] * SIGNATURE_GRID + cell[np.newaxis, :]
+    hist = np.bincount((cell_id.astype(np.int32) * _LBP_BINS + _LBP_TABLE[code]).ravel(),
+                       minlength=SIGNATURE_GRID ** 2 * _LBP_BINS).astype(np.float32)
+    sig = np.sqrt(hist)
+    return sig / np.linalg.norm(sig)
+
+
+def signature_distances(signatures):
+    """全部两两签名距离 (n, n) float32，一次矩阵乘完成；没有签名（未检测到人脸）的行列为 inf"""
+    n = len(signatures)
+    valid = np.array([sig is not None for sig in signatures], bool)
+    dist = np.full((n, n), np.inf, np.float32)
+    if valid.any():
+        S = np.stack([sig for sig in signatures if sig is not None])
+        d = np.sqrt(np.maximum(2 - 2 * (S @ S.T), 0))
+        dist[np.ix_(valid, valid)] = d
+    return dist
+
+
+def prefilter_mask(signatures, threshold):
+    """签名距离不超过 threshold 的配对才交给 match_score；返回 (n, n) bool，只有上三角有意义"""
+    return np.triu(signature_distances(signatures) <= threshold, k=1)
+
+
+def evaluate_prefilter(descriptors, signatures, quantiles=(0.02, 0.05, 0.1, 0.2, 0.3, 0.5)):
+    """以穷举 match_score 的判定（>= MIN_MATCH_COUNT）为基准，统计不同签名阈值下的剪枝比例与召回损失
+
+    阈值取所有有效配对签名距离的若干分位数；耗时按 签名计算 + 保留比例 × 穷举匹配耗时 估算。
+    返回 [(阈值, 剪枝比例, 召回率, 估算加速)]。
+    """
+    n = len(descriptors)
+    iu = np.triu_indices(n, k=1)
+    start = time.perf_counter()
+    scores = np.zeros((n, n), np.int64)
+    for i in range(n - 1):
+        for j in range(i + 1, n):
+            scores[i, j] = match_score(descriptors[i], descriptors[j])
+    exhaustive_time = time.perf_counter() - start
+    start = time.perf_counter()
+    dist = signature_distances(signatures)[iu]
+    signature_time = time.perf_counter() - start  # 签名本身由 ROI 算出，另计见 face_signature
+
+    positive = scores[iu] >= MIN_MATCH_COUNT
+    finite = np.isfinite(dist)
+    rows = []
+    print(f"{n} 张人脸，{len(dist)} 对，穷举判定为同一人的 {int(positive.sum())} 对，穷举匹配耗时 {exhaustive_time:.2f}s")
+    print(f"{'阈值':>8} {'剪枝比例':>8} {'召回率':>8} {'估算加速':>8}")
+    for q in quantiles:
+        threshold = float(np.quantile(dist[finite], q)) if finite.any() else 0.0
+        kept = dist <= threshold
+        pruned = 1 - kept.mean()
+        recall = (kept & positive).sum() / max(int(positive.sum()), 1)
+        speedup = exhaustive_time / (signature_time + kept.mean() * exhaustive_time)
+        rows.append((threshold, pruned, recall, speedup))
+        print(f"{threshold:8.4f} {pruned:8.1%} {recall:8.1%} {speedup:7.1f}x")
+    return rows
+
+
+# ------------------ 并行匹配矩阵 ------------------
+_worker = {}  # 子进程内的状态：描述子列表、独立的 BFMatcher、结果矩阵 memmap
+
+
+def _init_match_worker(descriptors, matrix_path, mask_path=None):
+    cv2.setNumThreads(1)  # 并行度由进程数提供，避免每个进程再开线程池
+    if isinstance(descriptors, str):  # 人脸库目录：各进程自己 memmap，不经 pickle 传描述子
+        descriptors = FaceGallery(descriptors).descriptor_list()
+    _worker['des'] = descriptors
+    _worker['bf'] = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+    _worker['matrix'] = np.load(matrix_path, mmap_mode='r+')
+    _worker['mask'] = np.load(mask_path, mmap_mode='r') if mask_path else None
+
+
+def _match_rows(rows):
+    """子进程任务：计算若干行的上三角得分，直接写入共享的 memmap（行与对称的列）；被预筛掉的配对记 0 分"""
+    des, matcher, matrix, mask = _worker['des'], _worker['bf'], _worker['matrix'], _worker['mask']
+    n = len(des)
+    for i in rows:
+        scores = [match_score(des[i], des[j], matcher) if mask is None or mask[i, j] else 0
+                  for j in range(i + 1, n)]
+        matrix[i, i + 1:] = scores
+        matrix[i + 1:, i] = scores
+    matrix.flush()
+    return rows
+
+
+def upper_triangle_chunks(n, n_chunks):
+    """把上三角按行切成 n_chunks 块左右、每块配对数大致相等（第 i 行有 n-1-i 对）"""
+    total = n * (n - 1) // 2
+    target = max(total // max(n_chunks, 1), 1)
+    chunks, cur, size = [], [], 0
+    for i in range(n - 1):
+        cur.append(i)
+        size += n - 1 - i
+        if size >= target:
+            chunks.append(cur)
+            cur, size = [], 0
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+def parallel_match_matrix(descriptors, matrix_path, workers=None, chunks_per_worker=8, on_rows=None,
+                          pair_mask=None):
+    """多进程构建匹配度矩阵，结果写在 matrix_path（.npy memmap）里并返回该 memmap
+
+    上三角按配对数均衡切块分给各进程，每个进程有自己的 BFMatcher；
+    每完成一块就回调 on_rows(已完成行列表, 累计完成配对数, 总配对数)，此时这些行已写入文件可读。
+    descriptors 也可以是 FaceGallery，此时子进程按目录各自打开 memmap。
+    pair_mask 为 prefilter_mask 的结果时，只计算其中为 True 的配对（掩码写成 .npy 供子进程 memmap）。
+    """
+    n = len(descriptors)
+    if isinstance(descriptors, FaceGallery):
+        descriptors = descriptors.path
+    workers = workers or os.cpu_count() or 1
+    matrix = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.int32, shape=(n, n))
+    np.fill_diagonal(matrix, -1)  # 用-1表示同一张图片
+    matrix.flush()
+
+    total = n * (n - 1) // 2
+    done = 0
+    chunks = upper_triangle_chunks(n, workers * chunks_per_worker)
+    mask_path = None
+    if pair_mask is not None:
+        mask_path = os.path.splitext(matrix_path)[0] + "_mask.npy"
+        np.save(mask_path, pair_mask)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_match_worker,
+                             initargs=(descriptors, matrix_path, mask_path)) as pool:
+        for fut in as_completed([pool.submit(_match_rows, rows) for rows in chunks]):
+            rows = fut.result()
+            done += sum(n - 1 - i for i in rows)
+            if on_rows is not None:
+                on_rows(rows, done, total)
+    return matrix
+
+
+def generate_match_matrix(pattern="*.PNG", cache_dir=None, workers=1, matrix_path=None, gallery=None,
+                          prefilter=None):
+    """自动生成当前目录下所有PNG图像的匹配度矩阵
+
+    先对每张图提取一次特征（可用 cache_dir 落盘复用），再只计算上三角的 n(n-1)/2 对，
+    下三角取对称值。workers > 1 时用 parallel_match_matrix 多进程计算，
+    矩阵写入 matrix_path（缺省为临时 .npy 文件）。
+    传入 FaceGallery 时不读图，直接对库中全部条目建矩阵。
+    prefilter 为签名距离阈值时，先用 face_signature 两两比较，只把距离不超过阈值的配对交给 match_score，
+    其余记 0 分（人脸库不保存 ROI，不支持预筛）。
+    """
+    if gallery is not None:
+        image_files = gallery.names
+        features = gallery.descriptor_list()
+        print(f"人脸库 {gallery.path} 共 {len(image_files)} 条")
+        if not image_files:
+            return
+    else:
+        # 查找当前目录下所有PNG格式的图像
+        image_files = sorted(glob.glob(pattern))
+        if not image_files:
+            print(f"当前目录未找到{pattern}图像文件")
+            return
+
+        print(f"找到 {len(image_files)} 个图像文件:")
+        for i, file in enumerate(image_files):
+            print(f"{i + 1}. {file}")
+
+        # 每张图只提取一次特征
+        cache = FeatureCache(cache_dir)
+        features, signatures = [], []
+        for file in image_files:
+            roi, des = cache.get(file)
+            if roi is None:
+                print(f"未检测到人脸: {file}")
+            features.append(des if roi is not None else None)
+            signatures.append(face_signature(roi) if prefilter is not None else None)
 
-    # 创建匹配度矩阵
     n = len(image_files)
-    match_matrix = np.zeros((n, n), dtype=int)
-
-    # 填充矩阵
-    for i in range(n):
-        for j in range(n):
-            if i == j:
-                # 同一张图片，显示特殊标记
-                match_matrix[i][j] = -1  # 用-1表示同一张图片
-            else:
-                score = compare_two_faces(image_files[i], image_files[j])
-                match_matrix[i][j] = score
+    pair_mask = None
+    if prefilter is not None:
+        if gallery is not None:
+            print("人脸库没有保存 ROI，忽略预筛")
+        else:
+            pair_mask = prefilter_mask(signatures, prefilter)
+            kept = int(pair_mask.sum())
+            print(f"签名预筛：{n * (n - 1) // 2} 对中保留 {kept} 对交给 ORB 匹配")
+
+    if workers > 1:
+        if matrix_path is None:
+            matrix_path = os.path.join(tempfile.mkdtemp(prefix="match_"), "match_matrix.npy")
+
+        def progress(rows, done, total):
+            print(f"已完成第 {rows[0] + 1}-{rows[-1] + 1} 行，{done}/{total} 对 ({done / total:.0%})")
+
+        match_matrix = parallel_match_matrix(gallery if gallery is not None else features,
+                                             matrix_path, workers, on_rows=progress, pair_mask=pair_mask)
+        print(f"匹配度矩阵已写入: {matrix_path}")
+    else:
+        # 创建匹配度矩阵
+        match_matrix = np.zeros((n, n), dtype=int)
+        np.fill_diagonal(match_matrix, -1)  # 用-1表示同一张图片
+
+        # 只填充上三角，下三角对称
+        for i in range(n):
+            for j in range(i + 1, n):
+                if pair_mask is not None and not pair_mask[i, j]:
+                    continue  # 签名差距过大，直接判为不同人（0 分）
+                score = match_score(features[i], features[j])
+                match_matrix[i][j] = match_matrix[j][i] = score
                 print(f"已比较: {image_files[i]} vs {image_files[j]} = {score} 匹配得分")
 
     # 输出结果
@@ -157,22 +645,231 @@ def generate_match_matrix():
         for j in range(i + 1, n):  # 只输出上三角部分避免重复
             result = "是" if match_matrix[i][j] >= MIN_MATCH_COUNT else "不是"
             print(f"{image_files[i]} vs {image_files[j]}: {result}同一人 ({match_matrix[i][j]}匹配得分)")
+    return image_files, match_matrix
+
+
+# ------------------ 1:N 检索索引 ------------------
+class FaceIndex:
+    """1:N 人脸检索索引：对 256 位 ORB 描述子做按位采样 LSH
+
+    n_tables 张哈希表，每张取固定的 bits_per_key 个比特拼成键；检索时查询描述子与库内描述子
+    键相同即投一票，按票数取前 shortlist 个候选，再用 match_score 的比值检验精排。
+    每张表内键排好序、用二分查找取桶，查询代价只与命中的桶大小有关。
+    """
+
+    def __init__(self, n_tables=12, bits_per_key=16, max_bucket=2000, seed=0):
+        rng = np.random.default_rng(seed)
+        self.positions = np.stack([rng.choice(256, bits_per_key, replace=False) for _ in range(n_tables)])
+        self.max_bucket = max_bucket  # 过于常见的键几乎不含身份信息，跳过
+        self.names = []
+        self.descriptors = []
+        self._tables = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def _keys(self, des):
+        """(N, 32) uint8 描述子 → (N, n_tables) 整数键"""
+        cols = np.ascontiguousarray(des.T).astype(np.int64)  # (32, N)，按字节行取比特是连续访问
+        keys = np.zeros((len(self.positions), len(des)), np.int64)
+        for t, pos in enumerate(self.positions):
+            for b, p in enumerate(pos):
+                # 与 np.unpackbits 一致：第 p 位是第 p//8 个字节的高位起第 p%8 位
+                keys[t] |= ((cols[p >> 3] >> (7 - (p & 7))) & 1) << b
+        return keys.T
+
+    def enroll(self, name, des):
+        """登记一张人脸的描述子，返回其条目编号；des 为 None/过少时不登记并返回 None"""
+        if des is None or len(des) < 2:
+            return None
+        self.names.append(name)
+        self.descriptors.append(des)
+        self._tables = None  # 下次检索前重建有序表
+        return len(self.names) - 1
+
+    def _build(self):
+        owners = np.concatenate([np.full(len(d), i, np.int32) for i, d in enumerate(self.descriptors)])
+        keys = self._keys(np.concatenate(self.descriptors))
+        self._tables = []
+        for t in range(keys.shape[1]):
+            order = np.argsort(keys[:, t])
+            self._tables.append((keys[order, t], owners[order]))
+
+    def candidates(self, des, shortlist=50):
+        """LSH 投票，返回票数最高的至多 shortlist 个条目编号"""
+        if self._tables is None:
+            self._build()
+        votes = []
+        for t, q in enumerate(self._keys(des).T):
+            keys, owners = self._tables[t]
+            lo = np.searchsorted(keys, q, 'left')
+            hi = np.searchsorted(keys, q, 'right')
+            lens = hi - lo
+            lens[lens > self.max_bucket] = 0
+            total = int(lens.sum())
+            if total:
+                # 把若干 [lo, hi) 区间拼成一个下标数组
+                votes.append(owners[np.repeat(lo - np.cumsum(lens) + lens, lens) + np.arange(total)])
+        if not votes:
+            return np.empty(0, np.int32)
+        ids, counts = np.unique(np.concatenate(votes), return_counts=True)
+        return ids[np.argsort(-counts, kind='stable')[:shortlist]]
+
+    def search(self, des, top_k=5, shortlist=50):
+        """返回按 match_score 降序的 [(名字, 得分, 条目编号)]，至多 top_k 个"""
+        if des is None or len(des) < 2 or not self.names:
+            return []
+        ids = self.candidates(des, shortlist)
+        scores = match_scores_batch(des, [self.descriptors[i] for i in ids])
+        scored = sorted(zip(scores.tolist(), ids.tolist()), key=lambda x: -x[0])
+        return [(self.names[i], score, i) for score, i in scored[:top_k]]
+
+    def brute_force(self, des, top_k=5):
+        """对全部条目做 match_score，作为召回率基线"""
+        scores = match_scores_batch(des, self.descriptors)
+        scored = sorted(enumerate(scores.tolist()), key=lambda x: -x[1])
+        scored = [(score, i) for i, score in scored]
+        return [(self.names[i], score, i) for score, i in scored[:top_k]]
+
+    def save(self, path):
+        np.savez(path, positions=self.positions, max_bucket=self.max_bucket,
+                 names=np.array(self.names, dtype=str),
+                 offsets=np.cumsum([0] + [len(d) for d in self.descriptors]),
+                 descriptors=np.concatenate(self.descriptors) if self.descriptors else np.empty((0, 32), np.uint8))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            index = cls(n_tables=z['positions'].shape[0], bits_per_key=z['positions'].shape[1],
+                        max_bucket=int(z['max_bucket']))
+            index.positions = z['positions']
+            offsets, blob = z['offsets'], z['descriptors']
+            index.names = [str(n) for n in z['names']]
+            index.descriptors = [blob[offsets[i]:offsets[i + 1]] for i in range(len(index.names))]
+        return index
+
+
+def enroll_images(index, paths, cache=None, all_faces=False, verify=False):
+    """把一批图像（名字取文件名去扩展名）登记进索引，返回成功登记的数量
+
+    all_faces=True 时合照中的每张人脸分别登记，名字为 "文件名#序号"（序号按检测框顺序）。
+    """
+    cache = cache or FeatureCache()
+    count = 0
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if all_faces:
+            _, descriptors = extract_all_features(path, verify)
+            added = sum(index.enroll(f"{name}#{k}", des) is not None for k, des in enumerate(descriptors))
+            if not added:
+                print(f"未检测到人脸或特征过少，跳过: {path}")
+            count += added
+            continue
+        _, des = cache.get(path)
+        if index.enroll(name, des) is not None:
+            count += 1
+        else:
+            print(f"未检测到人脸或特征过少，跳过: {path}")
+    return count
+
+
+def evaluate_index(index, probe_descriptors, top_k=1, shortlist=50):
+    """以暴力 match_score 的 top-1 为基准，统计索引在 top_k 内的召回率，以及两者的每秒查询数"""
+    probes = [d for d in probe_descriptors if d is not None and len(d) >= 2]
+    if not probes:
+        print("没有可用的查询描述子")
+        return None
+    start = time.perf_counter()
+    truth = [index.brute_force(d, 1)[0][2] for d in probes]
+    brute_time = time.perf_counter() - start
+    start = time.perf_counter()
+    found = [[r[2] for r in index.search(d, top_k, shortlist)] for d in probes]
+    index_time = time.perf_counter() - start
+
+    recall = sum(t in f for t, f in zip(truth, found)) / len(probes)
+    print(f"库大小 {len(index)}，查询 {len(probes)} 次")
+    print(f"召回率@{top_k}（相对暴力匹配 top-1）: {recall:.2%}")
+    print(f"暴力匹配 {len(probes) / brute_time:.1f} 次/秒，索引检索 {len(probes) / index_time:.1f} 次/秒")
+    return recall, len(probes) / brute_time, len(probes) / index_time
 
 
 # ------------------ 命令行一键测试 ------------------
 if __name__ == "__main__":
-    import argparse, sys
-
-    # 检查是否提供了命令行参数
-    if len(sys.argv) > 1:
-        parser = argparse.ArgumentParser(description="优化的零训练传统人脸识别")
-        parser.add_argument("img1", help="第一张人像路径")
-        parser.add_argument("img2", help="第二张人像路径")
-        args = parser.parse_args()
-
-        same = compare_two_faces(args.img1, args.img2)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="优化的零训练传统人脸识别")
+    parser.add_argument("img1", nargs="?", help="第一张人像路径（省略两张图时执行批量匹配）")
+    parser.add_argument("img2", nargs="?", help="第二张人像路径")
+    parser.add_argument("--pattern", default="*.PNG", help="批量匹配时的图像通配符")
+    parser.add_argument("--cache-dir", default=None, help="特征缓存目录（.npz），重复运行时跳过检测与描述")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="批量匹配的进程数")
+    parser.add_argument("--matrix-out", default=None, help="多进程时结果矩阵 .npy（memmap）路径")
+    parser.add_argument("--index", default=None, help="1:N 检索索引文件（.npz）")
+    parser.add_argument("--enroll", default=None, metavar="PATTERN", help="把匹配通配符的图像登记进 --index")
+    parser.add_argument("--search", default=None, metavar="IMG", help="在 --index 中检索这张人像")
+    parser.add_argument("--eval-index", default=None, metavar="PATTERN",
+                        help="用这些图像作查询，对比 --index 与暴力匹配的召回率和速度")
+    parser.add_argument("--top-k", type=int, default=5, help="检索返回的候选数")
+    parser.add_argument("--all-faces", action="store_true",
+                        help="登记/检索时使用图中的每一张人脸（合照），而不只是最大的一张")
+    parser.add_argument("--verify", action="store_true", help="大图缩小检测后在原图小 ROI 内复核人脸")
+    parser.add_argument("--gallery", default=None, metavar="DIR",
+                        help="持久化人脸库目录：配合 --enroll 追加登记；比对时按名字读库；无图片参数时对库建矩阵")
+    parser.add_argument("--prefilter", type=float, default=None, metavar="DIST",
+                        help="批量匹配前用全局签名预筛，只比对签名距离不超过 DIST 的配对")
+    parser.add_argument("--eval-prefilter", default=None, metavar="PATTERN",
+                        help="用这些图像统计不同预筛阈值下的剪枝比例与召回损失")
+    parser.add_argument("--bench-match", default=None, metavar="PATTERN",
+                        help="用这些图像核对并计时 BFMatcher 与 NumPy 匹配路径")
+    args = parser.parse_args()
+
+    if args.eval_prefilter:
+        cache = FeatureCache(args.cache_dir)
+        feats = [cache.get(p) for p in sorted(glob.glob(args.eval_prefilter))]
+        evaluate_prefilter([des for _, des in feats], [face_signature(roi) for roi, _ in feats])
+    elif args.bench_match:
+        cache = FeatureCache(args.cache_dir)
+        benchmark_match([cache.get(p)[1] for p in sorted(glob.glob(args.bench_match))])
+    elif args.enroll or args.search or args.eval_index:
+        if not args.index and not (args.gallery and args.enroll and not (args.search or args.eval_index)):
+            parser.error("--enroll 需要 --index 或 --gallery；--search/--eval-index 需要 --index")
+        cache = FeatureCache(args.cache_dir)
+        paths = sorted(glob.glob(args.enroll)) if args.enroll else []
+        if args.gallery and args.enroll:
+            gallery = FaceGallery(args.gallery)
+            count = enroll_images(gallery, paths, cache, args.all_faces, args.verify)
+            print(f"新登记 {count} 张人脸，人脸库共 {len(gallery)} 条 → {args.gallery}")
+        if args.index:
+            if args.enroll:
+                index = FaceIndex.load(args.index) if os.path.exists(args.index) else FaceIndex()
+                count = enroll_images(index, paths, cache, args.all_faces, args.verify)
+                index.save(args.index)
+                print(f"新登记 {count} 张人脸，索引共 {len(index)} 条 → {args.index}")
+            else:
+                index = FaceIndex.load(args.index)
+        if args.search:
+            if args.all_faces:
+                faces, probes = extract_all_features(args.search, args.verify)
+            else:
+                faces, probes = [None], [cache.get(args.search)[1]]
+            for box, des in zip(faces, probes):
+                if box is not None:
+                    print(f"人脸 [x={box[0]}, y={box[1]}, w={box[2]}, h={box[3]}]:")
+                for rank, (name, score, _) in enumerate(index.search(des, args.top_k), 1):
+                    print(f"{rank}. {name}  {score} 匹配得分  {'是' if score >= MIN_MATCH_COUNT else '不是'}同一人")
+        if args.eval_index:
+            probes = [cache.get(p)[1] for p in sorted(glob.glob(args.eval_index))]
+            evaluate_index(index, probes, top_k=1)
+    # 检查是否提供了两张图片
+    elif args.img1 and args.img2:
+        same = compare_two_faces(args.img1, args.img2,
+                                 gallery=FaceGallery(args.gallery) if args.gallery else None)
         print("匹配得分：", same)
         print(">>> 判定结果：{}同一人 <<<".format("是" if same >= MIN_MATCH_COUNT else "不是"))
+    elif args.img1:
+        parser.error("比对模式需要两张图片")
     else:
-        # 如果没有命令行参数，则执行批量匹配
-        generate_match_matrix()
+        # 如果没有提供图片，则执行批量匹配
+        generate_match_matrix(args.pattern, args.cache_dir, args.workers, args.matrix_out,
+                              gallery=FaceGallery(args.gallery) if args.gallery else None,
+                              prefilter=args.prefilter)
@@ -1,36 +1,156 @@
 # face_detection_gui.py
 import cv2
-import tkinter as tk
-from tkinter import filedialog, messagebox
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
+except ImportError:  # 无图形环境的服务器上只用批处理命令行
+    tk = None
+import base64
+import csv
+import io
+import json
 import os
+import queue
+import threading
+import time
 import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from face_detect import HAAR_PATH, detect_faces, draw_faces
 
 # ---------- 可调参数 ----------
-HAAR_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+VERIFY_FACES = True  # 大图在缩小图上检测后，是否在原图小 ROI 内复核
+DETECT_WORKERS = max(1, min(4, os.cpu_count() or 1))  # 后台检测线程数（OpenCV 计算时释放 GIL）
+THUMB_SIZE = 180  # 缩略图边长
+THUMB_COLUMNS = 4  # 缩略图网格列数
+POLL_MS = 50  # 主线程轮询结果队列的间隔
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+DETECT_PARAMS = dict(scaleFactor=1.2, minNeighbors=5, minSize=(30, 30))
+CSV_FIELDS = ["path", "width", "height", "face", "x", "y", "w", "h", "error"]
+LIVE_DETECT_EVERY = 10  # 实时模式：每隔多少帧跑一次级联，其余帧用光流跟踪
+LIVE_PROC_WIDTH = 640  # 实时模式：检测与跟踪在这个宽度的缩小灰度图上进行
+LIVE_MIN_POINTS = 6  # 跟踪点少于该值时丢弃这个框，等下一次检测
+# 阶段名用 ASCII（cv2.putText 不能画中文），控制台汇总时换成中文
+STAGE_NAMES = {"capture": "采集", "detect": "检测", "track": "跟踪", "render": "渲染", "e2e": "端到端"}
 # ------------------------------
 
-# 加载人脸检测器
-face_cascade = cv2.CascadeClassifier(HAAR_PATH)
+# 每个检测线程各用一个级联分类器（同一个 CascadeClassifier 不保证可被多线程同时调用）
+_thread_state = threading.local()
+
+
+def thread_cascade():
+    """当前线程专属的人脸检测器，首次调用时加载"""
+    if not hasattr(_thread_state, "cascade"):
+        _thread_state.cascade = cv2.CascadeClassifier(HAAR_PATH)
+    return _thread_state.cascade
+
+
+def read_image(image_path):
+    """读取彩色图像，兼容中文路径"""
+    # 尝试使用cv2.imread直接读取
+    img = cv2.imread(image_path)
+    if img is None:
+        # 如果直接读取失败，尝试使用numpy从文件读取
+        with open(image_path, 'rb') as f:
+            file_bytes = np.asarray(bytearray(f.read()), dtype=np.uint8)
+            img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError("图片读取失败，请检查路径")
+    return img
+
+
+def detect_image_faces(image_path, draw=False, cascade=None, verify=VERIFY_FACES):
+    """
+    不依赖界面的人脸检测
+
+    Args:
+        image_path (str): 图片路径
+        draw (bool): 是否在返回的图像上原地画框
+        cascade: 人脸检测器，缺省为 face_detect 模块级检测器
+        verify (bool): 大图缩小检测后是否在原图小 ROI 内复核
+
+    Returns:
+        tuple: (图像, (N, 4) 人脸框数组 [x, y, w, h])
+    """
+    img = read_image(image_path)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # 检测人脸（大图先缩小检测，框映射回原图）
+    faces = detect_faces(gray, verify=verify, cascade=cascade, **DETECT_PARAMS)
+    if draw:
+        # 在检测到的人脸周围绘制矩形框并添加标签
+        draw_faces(img, faces)
+    return img, faces
+
+
+def annotated_path(image_path, annotate_dir=None, root=None):
+    """detected_ 结果图路径：缺省与原图同目录；给定 annotate_dir 时按相对 root 的目录结构放入其中
+
+    root 为 None 时（输入不在同一盘符下，没有公共上级目录）按原图的完整路径（盘符作为第一级目录）放入，
+    保证不同目录下的同名图像不会互相覆盖。
+    """
+    directory, filename = os.path.split(os.path.abspath(image_path))
+    if annotate_dir:
+        if root:
+            directory = os.path.join(annotate_dir, os.path.relpath(directory, root))
+        else:
+            drive, rest = os.path.splitdrive(directory)
+            directory = os.path.join(annotate_dir, drive.rstrip(":\\/"), rest.lstrip("\\/"))
+    return os.path.join(directory, f"detected_{filename}")
+
+
+def common_root(paths):
+    """所有输入（目录本身或文件所在目录）的公共上级目录；不同盘符时为 None"""
+    dirs = [os.path.abspath(p if os.path.isdir(p) else os.path.dirname(p)) for p in paths]
+    try:
+        return os.path.commonpath(dirs)
+    except ValueError:
+        return None
+
+
+def write_image(path, img):
+    """按扩展名编码写盘（兼容中文路径），返回是否成功"""
+    ok, buf = cv2.imencode(os.path.splitext(path)[1] or ".png", img)
+    if ok:
+        buf.tofile(path)
+    return ok
 
 
 class FaceDetectionGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("人脸检测工具")
-        self.root.geometry("400x200")
+        self.root.geometry("800x640")
+
+        # 后台检测：线程池执行，结果经队列回到主线程，由 root.after 轮询
+        self.executor = ThreadPoolExecutor(max_workers=DETECT_WORKERS)
+        self.results = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.futures = []
+        self.total = 0
+        self.pending = 0
+        self.done_count = 0
+        self.face_total = 0
+        self.errors = []
+        self.thumbs = []  # 持有 PhotoImage 引用，避免被回收后画布变空
 
         # 创建界面元素
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
         # 标题
         title_label = tk.Label(self.root, text="人脸检测工具", font=("Arial", 16))
         title_label.pack(pady=10)
 
-        # 选择图片按钮
-        select_btn = tk.Button(self.root, text="选择图片", command=self.select_image,
-                               width=20, height=2, font=("Arial", 12))
-        select_btn.pack(pady=10)
+        # 按钮行：选择图片（可多选）、取消
+        button_row = tk.Frame(self.root)
+        button_row.pack(pady=5)
+        self.select_btn = tk.Button(button_row, text="选择图片", command=self.select_image,
+                                    width=20, height=2, font=("Arial", 12))
+        self.select_btn.pack(side=tk.LEFT, padx=5)
+        self.cancel_btn = tk.Button(button_row, text="取消", command=self.cancel,
+                                    width=10, height=2, font=("Arial", 12), state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
 
         # 保存图片复选框
         self.save_var = tk.BooleanVar()
@@ -38,10 +158,23 @@ class FaceDetectionGUI:
                                        variable=self.save_var, font=("Arial", 10))
         save_checkbox.pack(pady=5)
 
+        # 进度条
+        self.progress = ttk.Progressbar(self.root, orient=tk.HORIZONTAL, length=600, mode="determinate")
+        self.progress.pack(pady=5)
+
         # 状态标签
-        self.status_label = tk.Label(self.root, text="请选择一张图片开始检测",
+        self.status_label = tk.Label(self.root, text="请选择图片开始检测（可多选）",
                                      font=("Arial", 10))
-        self.status_label.pack(pady=10)
+        self.status_label.pack(pady=5)
+
+        # 结果缩略图网格（可滚动画布）
+        grid_frame = tk.Frame(self.root)
+        grid_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.canvas = tk.Canvas(grid_frame, bg="white")
+        scrollbar = tk.Scrollbar(grid_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
     def detect_and_draw_faces(self, image_path):
         """
@@ -54,43 +187,65 @@ class FaceDetectionGUI:
             tuple: (带人脸框的图像, 检测到的人脸数量)
         """
         try:
-            # 尝试使用cv2.imread直接读取
-            img = cv2.imread(image_path)
-            if img is None:
-                # 如果直接读取失败，尝试使用numpy从文件读取
-                with open(image_path, 'rb') as f:
-                    file_bytes = np.asarray(bytearray(f.read()), dtype=np.uint8)
-                    img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-            if img is None:
-                raise FileNotFoundError("图片读取失败，请检查路径")
-
-            # 转换为灰度图
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-            # 检测人脸
-            faces = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.2,
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
-
-            # 在检测到的人脸周围绘制矩形框
-            for (x, y, w, h) in faces:
-                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                # 添加标签
-                cv2.putText(img, 'Face', (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-
+            img, faces = detect_image_faces(image_path, draw=True, cascade=thread_cascade())
             return img, len(faces)
 
         except Exception as e:
             raise FileNotFoundError(f"图片读取失败: {str(e)}")
 
+    def process_image(self, image_path, save):
+        """
+        后台线程中执行：检测人脸、按需保存结果、生成缩略图
+
+        Args:
+            image_path (str): 图片路径
+            save (bool): 是否保存 detected_ 结果图
+
+        Returns:
+            tuple: (检测到的人脸数量, 保存信息, 缩略图 PNG 的 base64 字符串)
+        """
+        # 验证文件是否存在
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"文件不存在: {image_path}")
+
+        # 验证文件是否可读
+        if not os.access(image_path, os.R_OK):
+            raise PermissionError(f"没有权限读取文件: {image_path}")
+
+        # 检测人脸
+        result_img, face_count = self.detect_and_draw_faces(image_path)
+
+        # 保存图片（如果勾选了保存选项）
+        save_info = ""
+        if save:
+            output_path = annotated_path(image_path)
+            if write_image(output_path, result_img):
+                save_info = f"已保存: {output_path}"
+            else:
+                save_info = "保存文件时出错"
+
+        # 缩略图在后台线程生成，主线程只需把 PNG 数据交给 PhotoImage
+        h, w = result_img.shape[:2]
+        scale = THUMB_SIZE / max(h, w)
+        thumb = cv2.resize(result_img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        thumb_png = base64.b64encode(cv2.imencode(".png", thumb)[1].tobytes()).decode("ascii")
+        return face_count, save_info, thumb_png
+
+    def _run_job(self, image_path, save):
+        """线程池任务：已取消则直接跳过；结果或异常都放入队列，由主线程处理"""
+        if self.cancel_event.is_set():
+            self.results.put(("cancelled", image_path, None))
+            return
+        try:
+            self.results.put(("done", image_path, self.process_image(image_path, save)))
+        except Exception as e:
+            self.results.put(("error", image_path, e))
+
     def select_image(self):
-        """选择图片文件并进行人脸检测"""
-        # 打开文件选择对话框
-        file_path = filedialog.askopenfilename(
+        """选择一张或多张图片文件，提交到后台线程池检测"""
+        # 打开文件选择对话框（可多选）
+        file_paths = filedialog.askopenfilenames(
             title="选择图片文件",
             filetypes=[
                 ("Image files", "*.jpg *.jpeg *.png *.bmp *.tiff *.JPG *.JPEG *.PNG *.BMP *.TIFF"),
@@ -98,78 +253,506 @@ class FaceDetectionGUI:
             ]
         )
 
-        if not file_path:  # 用户取消选择
+        if not file_paths:  # 用户取消选择
             return
-
-        try:
-            # 验证文件是否存在
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"文件不存在: {file_path}")
-
-            # 验证文件是否可读
-            if not os.access(file_path, os.R_OK):
-                raise PermissionError(f"没有权限读取文件: {file_path}")
-
-            # 更新状态
-            self.status_label.config(text="正在检测人脸...")
-            self.root.update()
-
-            # 检测人脸
-            result_img, face_count = self.detect_and_draw_faces(file_path)
-
-            # 保存图片（如果勾选了保存选项）
-            if self.save_var.get():
-                # 设置输出路径
-                directory = os.path.dirname(file_path)
-                filename = os.path.basename(file_path)
-                name, ext = os.path.splitext(filename)
-                output_path = os.path.join(directory, f"detected_{name}{ext}")
-
-                # 保存图像
-                success = cv2.imwrite(output_path, result_img)
-                if success:
-                    save_info = f"\n结果已保存到: {output_path}"
-                else:
-                    save_info = "\n保存文件时出错"
-            else:
-                save_info = ""
-
-            # 更新状态
-            self.status_label.config(text=f"检测完成！找到 {face_count} 张人脸{save_info}")
-
-            # 显示结果
-            self.display_result(file_path, result_img, face_count)
-
-        except FileNotFoundError as e:
-            error_msg = f"文件错误: {str(e)}"
-            messagebox.showerror("文件错误", error_msg)
-            self.status_label.config(text=error_msg)
-        except PermissionError as e:
-            error_msg = f"权限错误: {str(e)}"
-            messagebox.showerror("权限错误", error_msg)
-            self.status_label.config(text=error_msg)
-        except Exception as e:
-            error_msg = f"处理图片时出错: {str(e)}"
-            messagebox.showerror("错误", error_msg)
-            self.status_label.config(text="请选择一张图片开始检测")
-
-    def display_result(self, original_path, result_img, face_count):
+        self.start_batch(list(file_paths))
+
+    def start_batch(self, file_paths):
+        """清空上一批结果，提交一批图片并开始轮询结果队列"""
+        self.canvas.delete("all")
+        self.thumbs = []
+        self.cancel_event.clear()
+        self.total = self.pending = len(file_paths)
+        self.done_count = 0
+        self.face_total = 0
+        self.errors = []
+
+        self.progress.configure(maximum=len(file_paths), value=0)
+        self.select_btn.configure(state=tk.DISABLED)
+        self.cancel_btn.configure(state=tk.NORMAL)
+        self.status_label.config(text=f"正在检测人脸... 0/{len(file_paths)}")
+
+        save = self.save_var.get()  # Tk 变量只在主线程读取
+        self.futures = [self.executor.submit(self._run_job, path, save) for path in file_paths]
+        self.root.after(POLL_MS, self.poll_results)
+
+    def poll_results(self):
+        """主线程定时取出队列中的全部结果并更新界面；批次未结束则继续轮询"""
+        while True:
+            try:
+                kind, path, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if kind == "done":
+                face_count, save_info, thumb_png = payload
+                self.done_count += 1
+                self.face_total += face_count
+                self.display_result(path, thumb_png, face_count, save_info)
+            elif kind == "error":
+                self.errors.append(f"{os.path.basename(path)}: {payload}")
+            self.progress.configure(value=self.total - self.pending)
+            self.status_label.config(text=f"正在检测人脸... {self.total - self.pending}/{self.total}")
+
+        if self.pending > 0:
+            self.root.after(POLL_MS, self.poll_results)
+        else:
+            self.finish_batch()
+
+    def finish_batch(self):
+        """批次结束：恢复按钮、汇总状态、集中报告错误"""
+        self.select_btn.configure(state=tk.NORMAL)
+        self.cancel_btn.configure(state=tk.DISABLED)
+        summary = f"检测完成！{self.done_count} 张图片，共找到 {self.face_total} 张人脸"
+        if self.cancel_event.is_set():
+            summary = f"已取消。{summary}"
+        self.status_label.config(text=summary)
+        if self.errors:
+            messagebox.showerror("处理图片时出错", "\n".join(self.errors))
+
+    def cancel(self):
+        """取消尚未开始的任务；正在检测的图片会在完成后照常显示"""
+        self.cancel_event.set()
+        for future in self.futures:
+            if future.cancel():  # 还在排队的任务不会再执行，这里替它记一次结果
+                self.results.put(("cancelled", None, None))
+        self.cancel_btn.configure(state=tk.DISABLED)
+        self.status_label.config(text="正在取消...")
+
+    def display_result(self, original_path, thumb_png, face_count, save_info=""):
         """
-        显示检测结果
+        在画布网格中追加一张结果缩略图
 
         Args:
             original_path (str): 原始图片路径
-            result_img (numpy.ndarray): 检测后的图像
+            thumb_png (str): 带人脸框缩略图的 PNG（base64）
             face_count (int): 检测到的人脸数量
+            save_info (str): 保存结果说明
         """
-        # 获取文件名用于窗口标题
-        filename = os.path.basename(original_path)
-
-        # 创建新窗口显示结果
-        cv2.imshow(f'人脸检测结果 - {filename} (检测到 {face_count} 张人脸)', result_img)
-
-        # 提示信息
-        messagebox.showinfo("检测完成", f"检测完成！\n找到 {face_count} 张人脸\n\n按任意键关闭图像窗口")
+        index = len(self.thumbs)
+        cell = THUMB_SIZE + 20
+        x = (index % THUMB_COLUMNS) * cell + cell // 2
+        y = (index // THUMB_COLUMNS) * (cell + 20) + THUMB_SIZE // 2 + 10
+
+        photo = tk.PhotoImage(data=thumb_png)
+        self.thumbs.append(photo)
+        item = self.canvas.create_image(x, y, image=photo)
+        self.canvas.create_text(x, y + THUMB_SIZE // 2 + 12, width=cell - 10,
+                                text=f"{os.path.basename(original_path)}  ({face_count} 张人脸)")
+        if save_info:
+            # 鼠标悬停时在状态栏显示保存位置
+            self.canvas.tag_bind(item, "<Enter>", lambda e: self.status_label.config(text=save_info))
+        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+
+    def on_close(self):
+        """关闭窗口：取消排队任务，不等待正在运行的检测"""
+        self.cancel_event.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
+
+# ------------------ 无界面批处理 ------------------
+def walk_images(paths):
+    """依次产出目录树（或单个文件）中的图像路径；跳过 detected_ 结果图。逐个产出，不把百万级列表放进内存"""
+    for src in paths:
+        if os.path.isfile(src):
+            yield src
+            continue
+        for dirpath, dirnames, filenames in os.walk(src):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(IMAGE_EXTS) and not name.startswith("detected_"):
+                    yield os.path.join(dirpath, name)
+
+
+def _batch_job(image_path, annotate, annotate_dir, root, verify):
+    """进程池任务：返回一条记录 dict；出错时记录 error 而不抛出，避免一张坏图中断整批"""
+    record = {"path": image_path, "width": None, "height": None, "faces": [], "error": None}
+    try:
+        img, faces = detect_image_faces(image_path, draw=annotate, verify=verify)
+        record.update(height=img.shape[0], width=img.shape[1], faces=faces.tolist())
+        if annotate:
+            out = annotated_path(image_path, annotate_dir, root)
+            os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+            if not write_image(out, img):
+                record["error"] = f"保存文件时出错: {out}"
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def _csv_line(row):
+    """按 _write_record 的格式把一行 CSV 编码成字符串"""
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(row)
+    return buf.getvalue()
+
+
+def _prepare_output(output_path, fmt):
+    """读取已有输出中记录过的路径，并截掉崩溃时写了一半的记录，便于续写
+
+    jsonl 每张图一行，截掉不完整的末行即可。csv 一张图可能占多行，崩溃时可能只落盘了其中几行，
+    所以连同末行所属图片的全部行一起截掉，续跑时重新检测这张图。
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if fmt == "csv" and end:
+            start = data.rfind(b"\n", 0, end - 1) + 1
+            last = next(csv.reader([data[start:end].decode("utf-8")]), [])
+            if start and last and last != CSV_FIELDS:
+                prefix = _csv_line(last[:1]).rstrip("\n").encode("utf-8") + b","
+                while start and data.startswith(prefix, start):
+                    end = start
+                    start = data.rfind(b"\n", 0, end - 1) + 1
+        if end < len(data):
+            f.truncate(end)
+    text = data[:end].decode("utf-8")
+    if fmt == "jsonl":
+        done.update(json.loads(line)["path"] for line in text.splitlines() if line.strip())
+    else:
+        done.update(row["path"] for row in csv.DictReader(text.splitlines()))
+    return done
+
+
+def _write_record(f, fmt, record):
+    """jsonl 每张图一行；csv 每张人脸一行，没有人脸的图写一行空框，保证每张图都有记录"""
+    if fmt == "jsonl":
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return
+    base = [record["path"], record["width"], record["height"]]
+    if record["faces"]:
+        rows = [base + [k] + box + [record["error"] or ""] for k, box in enumerate(record["faces"])]
+    else:
+        rows = [base + ["", "", "", "", "", record["error"] or ""]]
+    f.write("".join(_csv_line(row) for row in rows))  # 一张图的所有行一次写入
+
+
+def detect_batch(paths, output_path, fmt=None, workers=None, annotate=False, annotate_dir=None,
+                 verify=VERIFY_FACES, max_pending=None):
+    """
+    无界面批量人脸检测，结果写成 JSON lines 或 CSV，可断点续跑
+
+    Args:
+        paths (list): 图像文件或目录（递归遍历）
+        output_path (str): 输出文件；已存在时跳过其中记录过的图片并追加写入
+        fmt (str): "jsonl" 或 "csv"，缺省按输出扩展名判断
+        workers (int): 进程数，缺省为 CPU 核数
+        annotate (bool): 是否保存画框的 detected_ 结果图
+        annotate_dir (str): 结果图目录，缺省与原图同目录
+        verify (bool): 大图缩小检测后是否在原图小 ROI 内复核
+        max_pending (int): 同时在途的任务数上限，缺省为 workers * 4
+
+    Returns:
+        tuple: (本次处理的图片数, 跳过的图片数, 检测到的人脸总数)
+    """
+    fmt = fmt or ("csv" if output_path.lower().endswith(".csv") else "jsonl")
+    done = _prepare_output(output_path, fmt)
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    processed = skipped = face_total = 0
+
+    new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    with open(output_path, "a", encoding="utf-8", newline="") as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        if fmt == "csv" and new_file:
+            csv.writer(f, lineterminator="\n").writerow(CSV_FIELDS)
+        pending = set()
+
+        def drain(block_until):
+            nonlocal pending, processed, face_total
+            finished, pending = wait(pending, return_when=block_until)
+            for future in finished:
+                record = future.result()
+                _write_record(f, fmt, record)
+                processed += 1
+                face_total += len(record["faces"])
+                if record["error"]:
+                    print(f"出错: {record['path']}: {record['error']}")
+            f.flush()  # 每批结果落盘，崩溃后从这里续跑
+
+        # 结果图保持相对全部输入的公共上级目录的层级：单个目录时即相对该目录，多个输入时同名文件也不冲突
+        root = common_root(paths) if annotate_dir else None
+        for image_path in walk_images(paths):
+            if image_path in done:
+                skipped += 1
+                continue
+            pending.add(pool.submit(_batch_job, image_path, annotate, annotate_dir, root, verify))
+            if len(pending) >= max_pending:
+                drain(FIRST_COMPLETED)
+        while pending:
+            drain(FIRST_COMPLETED)
+
+    print(f"处理 {processed} 张图片，跳过已记录的 {skipped} 张，检测到 {face_total} 张人脸 → {output_path}")
+    return processed, skipped, face_total
+
+
+# ------------------ 实时视频检测 ------------------
+class StageTimer:
+    """各阶段耗时统计：滑动平均用于画面读数，全部样本用于结束时的汇总"""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.ema = {}
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.ema[stage] = seconds if stage not in self.ema else \
+                self.ema[stage] + self.alpha * (seconds - self.ema[stage])
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def readout(self):
+        with self.lock:
+            return "  ".join(f"{k} {v * 1000:.1f}ms" for k, v in self.ema.items())
+
+    def summary(self):
+        with self.lock:
+            return {k: (float(np.mean(v)) * 1000, float(np.percentile(v, 95)) * 1000, len(v))
+                    for k, v in self.samples.items()}
+
+
+class FaceTracker:
+    """缩小灰度图上的人脸检测 + 帧间光流跟踪
+
+    级联检测在独立线程中异步进行：每 detect_every 帧把当前缩小灰度图交给检测线程（检测线程忙时跳过），
+    其余帧及检测期间都用 LK 光流跟踪已有的框，检测的耗时不会卡住逐帧处理。
+    检测结果（对应第 k 帧）回来后，在第 k 帧灰度图的框内取角点，一步光流带到当前帧，替换原有的框。
+    跟踪时每个框用 estimateAffinePartial2D 估计平移 + 缩放；跟踪点过少的框被丢弃，等下一次检测补回。
+    """
+
+    def __init__(self, detect_every=LIVE_DETECT_EVERY, proc_width=LIVE_PROC_WIDTH, timer=None):
+        self.detect_every = max(1, detect_every)
+        self.proc_width = proc_width
+        self.timer = timer
+        self.cascade = cv2.CascadeClassifier(HAAR_PATH)
+        self.prev_gray = None
+        self.tracks = []  # [(box 浮点 [x, y, w, h], 跟踪点 (N, 1, 2) float32)]
+        self.frame_index = 0
+        self._requests = queue.Queue(maxsize=1)
+        self._results = queue.Queue()
+        self._worker = threading.Thread(target=self._detect_loop, daemon=True)
+        self._worker.start()
+
+    def _detect_loop(self):
+        while True:
+            gray = self._requests.get()
+            if gray is None:
+                break
+            t0 = time.perf_counter()
+            scale = gray.shape[1] / self.full_width
+            min_side = max(1, round(DETECT_PARAMS["minSize"][0] * scale))
+            faces = detect_faces(gray, scaleFactor=DETECT_PARAMS["scaleFactor"],
+                                 minNeighbors=DETECT_PARAMS["minNeighbors"], minSize=(min_side, min_side),
+                                 max_side=None, cascade=self.cascade)
+            if self.timer:
+                self.timer.add("detect", time.perf_counter() - t0)
+            self._results.put((gray, faces))
+
+    def close(self):
+        """结束检测线程"""
+        try:
+            self._requests.get_nowait()
+        except queue.Empty:
+            pass
+        self._requests.put(None)
+        self._worker.join(timeout=1)
+
+    @staticmethod
+    def _points(gray, box):
+        x, y, w, h = (int(v) for v in box)
+        mask = np.zeros_like(gray)
+        # 只取框中间区域的角点，少受背景干扰
+        mask[max(0, y + h // 8):y + h - h // 8, max(0, x + w // 8):x + w - w // 8] = 255
+        pts = cv2.goodFeaturesToTrack(gray, maxCorners=40, qualityLevel=0.01, minDistance=3, mask=mask)
+        return pts if pts is not None else np.empty((0, 1, 2), np.float32)
+
+    def _track(self, prev_gray, gray, max_level=2):
+        if not self.tracks:
+            return
+        old = np.concatenate([pts for _, pts in self.tracks])
+        if len(old) == 0:
+            self.tracks = []
+            return
+        new, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, old, None,
+                                                  winSize=(15, 15), maxLevel=max_level)
+        status = status.ravel().astype(bool)
+        tracks, start = [], 0
+        for box, pts in self.tracks:
+            end = start + len(pts)
+            ok = status[start:end]
+            p0, p1 = old[start:end][ok], new[start:end][ok]
+            start = end
+            if len(p0) < LIVE_MIN_POINTS:
+                continue
+            m, _ = cv2.estimateAffinePartial2D(p0, p1)
+            if m is None:
+                continue
+            s = float(np.hypot(m[0, 0], m[1, 0]))
+            cx, cy = box[0] + box[2] / 2, box[1] + box[3] / 2
+            ncx, ncy = m @ np.array([cx, cy, 1.0])
+            w, h = box[2] * s, box[3] * s
+            tracks.append((np.array([ncx - w / 2, ncy - h / 2, w, h], np.float32), p1.reshape(-1, 1, 2)))
+        self.tracks = tracks
+
+    def update(self, frame):
+        """处理一帧 BGR 图像，返回原图坐标的人脸框 (N, 4) int 数组，以及本帧是否合入了新的检测结果"""
+        h, w = frame.shape[:2]
+        self.full_width = w
+        width = min(w, self.proc_width)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # 先转灰度再缩小，缩放只处理单通道
+        if width < w:
+            gray = cv2.resize(gray, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+        merged = False
+        try:
+            det_gray, faces = self._results.get_nowait()
+            # 检测结果对应较早的一帧：在那一帧取点，再一步跟踪到当前帧（帧间隔可能较大，多用一层金字塔）
+            self.tracks = [(box.astype(np.float32), self._points(det_gray, box)) for box in faces]
+            self._track(det_gray, gray, max_level=3)
+            merged = True
+        except queue.Empty:
+            if self.prev_gray is not None:
+                self._track(self.prev_gray, gray)
+
+        if self.frame_index % self.detect_every == 0:
+            try:
+                self._requests.put_nowait(gray)
+            except queue.Full:
+                pass  # 检测线程还在忙，这一轮跳过
+        self.prev_gray = gray
+        self.frame_index += 1
+        boxes = np.array([box for box, _ in self.tracks], np.float32).reshape(-1, 4) * (w / width)
+        return np.round(boxes).astype(np.int64), merged
+
+
+def _open_capture(source):
+    """source 为纯数字时当作摄像头编号，否则当作视频文件/流地址"""
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"无法打开视频源: {source}")
+    return cap
+
+
+def live_detect(source=0, detect_every=LIVE_DETECT_EVERY, proc_width=LIVE_PROC_WIDTH,
+                display=True, output=None, max_frames=None, queue_size=4):
+    """
+    摄像头/视频实时人脸检测：采集、检测、跟踪、渲染流水线并行
+
+    采集、跟踪各一个线程，级联检测在 FaceTracker 的检测线程中异步进行，
+    渲染（画框、读数、显示/写出）在主线程（HighGUI 需要在主线程调用）。
+    摄像头输入时采集队列满则丢弃最旧的帧以保证低延迟；视频文件输入时不丢帧。
+
+    Args:
+        source: 摄像头编号或视频路径
+        detect_every (int): 每隔多少帧跑一次级联
+        proc_width (int): 检测与跟踪使用的缩小宽度
+        display (bool): 是否用 cv2.imshow 显示（按 q 或 Esc 退出）
+        output (str): 可选，写出带框视频的路径
+        max_frames (int): 最多处理的帧数
+
+    Returns:
+        dict: {"fps": 整体帧率, "frames": 帧数, "stages": {阶段: (平均ms, p95 ms, 样本数)}}
+    """
+    cap = _open_capture(source)
+    is_camera = str(source).isdigit()
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    timer = StageTimer()
+    stop = threading.Event()
+    captured = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if is_camera and item is not None:
+                    try:
+                        q.get_nowait()  # 丢弃最旧的帧，保证显示的是最新画面
+                    except queue.Empty:
+                        pass
+
+    def capture_loop():
+        count = 0
+        while not stop.is_set() and (max_frames is None or count < max_frames):
+            t0 = time.perf_counter()
+            ok, frame = cap.read()
+            if not ok:
+                break
+            timer.add("capture", time.perf_counter() - t0)
+            put(captured, (count, frame, t0))
+            count += 1
+        put(captured, None)
+
+    def detect_loop():
+        tracker = FaceTracker(detect_every, proc_width, timer)
+        while True:
+            item = captured.get()
+            if item is None:
+                break
+            index, frame, t_cap = item
+            t0 = time.perf_counter()
+            boxes, _ = tracker.update(frame)
+            timer.add("track", time.perf_counter() - t0)
+            put(processed, (index, frame, boxes, t_cap))
+        tracker.close()
+        put(processed, None)
+
+    threads = [threading.Thread(target=capture_loop, daemon=True),
+               threading.Thread(target=detect_loop, daemon=True)]
+    for t in threads:
+        t.start()
+
+    writer = None
+    frames = 0
+    recent = []
+    start = time.perf_counter()
+    try:
+        while True:
+            item = processed.get()
+            if item is None:
+                break
+            index, frame, boxes, t_cap = item
+            t0 = time.perf_counter()
+            draw_faces(frame, boxes)
+            now = time.perf_counter()
+            recent = [t for t in recent if now - t < 1.0] + [now]
+            cv2.putText(frame, f"{len(recent)} fps  {timer.readout()}", (10, 25),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+            if output:
+                if writer is None:
+                    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"MJPG"), src_fps,
+                                             (frame.shape[1], frame.shape[0]))
+                writer.write(frame)
+            if display:
+                cv2.imshow("实时人脸检测 (q 退出)", frame)
+                if cv2.waitKey(1) & 0xFF in (ord("q"), 27):
+                    break
+            timer.add("render", time.perf_counter() - t0)
+            timer.add("e2e", time.perf_counter() - t_cap)
+            frames += 1
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=1)
+        cap.release()
+        if writer is not None:
+            writer.release()
+        if display:
+            cv2.destroyAllWindows()
+
+    elapsed = time.perf_counter() - start
+    result = {"fps": frames / elapsed if elapsed > 0 else 0.0, "frames": frames, "stages": timer.summary()}
+    print(f"共 {frames} 帧，平均 {result['fps']:.1f} fps")
+    for stage, (mean_ms, p95_ms, n) in result["stages"].items():
+        print(f"  {STAGE_NAMES.get(stage, stage):<4} 平均 {mean_ms:6.1f} ms  p95 {p95_ms:6.1f} ms  ({n} 次)")
+    return result
 
 
 def main():
@@ -180,4 +763,33 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="人脸检测工具（不带参数时打开图形界面）")
+    parser.add_argument("paths", nargs="*", help="批处理的图像文件或目录（递归遍历）")
+    parser.add_argument("-o", "--output", default="faces.jsonl", help="结果文件（.jsonl 或 .csv），已存在时续跑")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None, help="输出格式，缺省按扩展名判断")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，缺省为 CPU 核数")
+    parser.add_argument("--annotate", action="store_true", help="保存画框的 detected_ 结果图")
+    parser.add_argument("--annotate-dir", default=None, help="结果图目录，缺省与原图同目录")
+    parser.add_argument("--no-verify", action="store_true", help="大图缩小检测后不在原图复核")
+    parser.add_argument("--live", default=None, metavar="SOURCE",
+                        help="实时检测：摄像头编号（如 0）或视频文件路径")
+    parser.add_argument("--detect-every", type=int, default=LIVE_DETECT_EVERY, help="实时模式每隔多少帧检测一次")
+    parser.add_argument("--proc-width", type=int, default=LIVE_PROC_WIDTH, help="实时模式检测与跟踪的缩小宽度")
+    parser.add_argument("--live-output", default=None, help="实时模式写出带框视频的路径")
+    parser.add_argument("--no-display", action="store_true", help="实时模式不开窗口（只统计帧率或写出视频）")
+    parser.add_argument("--max-frames", type=int, default=None, help="实时模式最多处理的帧数")
+    args = parser.parse_args()
+
+    if args.live is not None:
+        live_detect(args.live, args.detect_every, args.proc_width, display=not args.no_display,
+                    output=args.live_output, max_frames=args.max_frames)
+    elif args.paths:
+        detect_batch(args.paths, args.output, args.format, args.workers,
+                     annotate=args.annotate or bool(args.annotate_dir), annotate_dir=args.annotate_dir,
+                     verify=not args.no_verify)
+    elif tk is None:
+        parser.error("当前环境没有 tkinter，请指定要批处理的图像或目录")
+    else:
+        main()